@@ -8,6 +8,8 @@ import requests
 from typing import Dict, Any
 import logging
 
+from backend.api_clients.feed_cache import cached_feed
+
 logger = logging.getLogger(__name__)
 
 WAQI_URL = "https://api.waqi.info/feed/@1666/"
@@ -154,58 +156,53 @@ def _convert_waqi_to_geojson(waqi_data: Dict[str, Any]) -> Dict[str, Any]:
         "features": features
     }
 
+@cached_feed("aqi", "AQI_CACHE_TTL", default_ttl=300, fallback=_load_mock_data)
 def fetch_live_aqi() -> Dict[str, Any]:
-    """Fetch live AQI data from WAQI API"""
+    """Fetch live AQI data from WAQI API (raises if unavailable; the cache falls back to mock data)"""
     token = os.getenv("WAQI_TOKEN", WAQI_TOKEN)
     
+    params = {"token": token}
+    response = requests.get(WAQI_URL, params=params, timeout=10)
+    response.raise_for_status()
+    
+    waqi_data = response.json()
+    
+    if waqi_data.get("status") == "ok":
+        geojson_data = _convert_waqi_to_geojson(waqi_data)
+        if geojson_data.get("features"):
+            return geojson_data
+    
+    # Try data.gov.sg as fallback
     try:
-        params = {"token": token}
-        response = requests.get(WAQI_URL, params=params, timeout=10)
+        response = requests.get(DATA_GOV_SG_POLLUTANT_URL, timeout=10)
         response.raise_for_status()
+        data = response.json()
         
-        waqi_data = response.json()
-        
-        if waqi_data.get("status") == "ok":
-            geojson_data = _convert_waqi_to_geojson(waqi_data)
-            if geojson_data.get("features"):
-                return geojson_data
-        
-        # Try data.gov.sg as fallback
-        try:
-            response = requests.get(DATA_GOV_SG_POLLUTANT_URL, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if "items" in data and len(data["items"]) > 0:
-                item = data["items"][0]
-                readings = item.get("readings", [])
-                if readings:
-                    pm25 = readings[0].get("value", 25.0)
-                    aqi = int((pm25 / 35.4) * 100)
-                    
-                    return {
-                        "type": "FeatureCollection",
-                        "features": [{
-                            "type": "Feature",
-                            "geometry": {
-                                "type": "Point",
-                                "coordinates": [103.85, 1.29]
-                            },
-                            "properties": {
-                                "pm25": round(pm25, 2),
-                                "pm10": round(pm25 * 1.4, 2),
-                                "aqi": aqi,
-                                "category": _get_aqi_category(pm25),
-                                "station": "Singapore"
-                            }
-                        }]
-                    }
-        except Exception as e:
-            logger.warning(f"data.gov.sg fallback failed: {e}")
-        
-        logger.warning("WAQI API returned no data, using mock")
-        return _load_mock_data()
-        
+        if "items" in data and len(data["items"]) > 0:
+            item = data["items"][0]
+            readings = item.get("readings", [])
+            if readings:
+                pm25 = readings[0].get("value", 25.0)
+                aqi = int((pm25 / 35.4) * 100)
+                
+                return {
+                    "type": "FeatureCollection",
+                    "features": [{
+                        "type": "Feature",
+                        "geometry": {
+                            "type": "Point",
+                            "coordinates": [103.85, 1.29]
+                        },
+                        "properties": {
+                            "pm25": round(pm25, 2),
+                            "pm10": round(pm25 * 1.4, 2),
+                            "aqi": aqi,
+                            "category": _get_aqi_category(pm25),
+                            "station": "Singapore"
+                        }
+                    }]
+                }
     except Exception as e:
-        logger.error(f"Error fetching AQI data: {e}", exc_info=True)
-        return _load_mock_data()
+        logger.warning(f"data.gov.sg fallback failed: {e}")
+    
+    raise RuntimeError("WAQI API returned no data")
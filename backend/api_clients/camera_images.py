@@ -0,0 +1,109 @@
+"""
+Async LTA Camera Image Fetcher
+Downloads camera snapshots concurrently over a shared keep-alive HTTP client
+"""
+import asyncio
+import os
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FETCH_CONCURRENCY = int(os.getenv("IMAGE_FETCH_CONCURRENCY", "32"))
+IMAGE_FETCH_PER_HOST = int(os.getenv("IMAGE_FETCH_PER_HOST", "16"))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+IMAGE_FETCH_RETRIES = int(os.getenv("IMAGE_FETCH_RETRIES", "2"))
+
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+_client: Optional[httpx.AsyncClient] = None
+_global_limit: Optional[asyncio.Semaphore] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled client, creating it on first use"""
+    global _client, _global_limit
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=httpx.Timeout(IMAGE_FETCH_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=IMAGE_FETCH_CONCURRENCY,
+                max_keepalive_connections=IMAGE_FETCH_CONCURRENCY,
+            ),
+            follow_redirects=True,
+        )
+        _global_limit = asyncio.Semaphore(IMAGE_FETCH_CONCURRENCY)
+        _host_limits.clear()
+    return _client
+
+
+async def close_client() -> None:
+    """Close the pooled client (called on application shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(IMAGE_FETCH_PER_HOST)
+    return _host_limits[host]
+
+
+async def fetch_image(url: str) -> bytes:
+    """
+    Download one image with bounded global/per-host concurrency.
+    Timeouts, transport errors and 5xx responses are retried with backoff;
+    4xx responses fail immediately.
+    """
+    client = get_client()
+    last_error: Optional[Exception] = None
+    for attempt in range(IMAGE_FETCH_RETRIES + 1):
+        try:
+            async with _global_limit, _host_limit(url):
+                response = await client.get(url)
+            response.raise_for_status()
+            return response.content
+        except httpx.HTTPStatusError as e:
+            last_error = e
+            if e.response.status_code < 500:
+                break
+        except httpx.TransportError as e:
+            last_error = e
+        if attempt < IMAGE_FETCH_RETRIES:
+            await asyncio.sleep(0.25 * (2 ** attempt))
+    raise last_error
+
+
+async def fetch_camera_images(cameras: List[Any]) -> Tuple[List[Tuple[Any, bytes]], List[Dict[str, str]]]:
+    """
+    Fetch the ImageLink of every camera in parallel.
+
+    Returns (fetched, failed): fetched is a list of (camera, image bytes) in
+    request order; failed lists {"CameraID", "error"} for cameras whose image
+    could not be downloaded, so callers can carry on with a partial snapshot.
+    """
+    results = await asyncio.gather(
+        *(fetch_image(cam.ImageLink) for cam in cameras),
+        return_exceptions=True,
+    )
+    fetched = []
+    failed = []
+    for cam, result in zip(cameras, results):
+        if isinstance(result, BaseException):
+            if isinstance(result, httpx.HTTPStatusError):
+                error = f"HTTP {result.response.status_code}"
+            else:
+                error = str(result) or type(result).__name__
+            logger.warning(f"Failed to download image for {cam.CameraID}: {error}")
+            failed.append({"CameraID": cam.CameraID, "error": error})
+        else:
+            fetched.append((cam, result))
+    return fetched, failed
@@ -0,0 +1,145 @@
+"""
+Shared cache for live upstream feeds (LTA, WAQI, data.gov.sg)
+TTL + stale-while-revalidate with a single in-flight refresh per source
+"""
+import os
+import time
+import threading
+import functools
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FeedCache:
+    """
+    Cache for one upstream feed.
+
+    - age < ttl: served from cache.
+    - ttl <= age < ttl + max_stale: served stale immediately while one
+      background thread refreshes the feed.
+    - no value yet (or older than that): fetched synchronously; concurrent
+      callers wait for the same upstream call instead of issuing their own.
+
+    fetch must raise when the upstream is unavailable: a failed refresh never
+    replaces the last good value, which keeps being served (marked stale). A
+    failure with nothing to serve is re-raised, and not retried for one ttl.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[], Dict[str, Any]], ttl: float, max_stale: Optional[float] = None):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_stale = max_stale if max_stale is not None else ttl * 10
+        self._value: Optional[Dict[str, Any]] = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+        self._error: Optional[Exception] = None
+        self._failed_at = 0.0
+
+    def _store(self, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._value = value
+            self._fetched_at = time.time()
+            self._error = None
+
+    def _refresh(self) -> None:
+        try:
+            with self._fetch_lock:
+                self._store(self.fetch())
+        except Exception as e:
+            logger.error(f"Background refresh of {self.name} feed failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _annotate(self, value: Dict[str, Any], fetched_at: float, stale: bool) -> Dict[str, Any]:
+        out = dict(value)
+        out["cache"] = {
+            "source": self.name,
+            "age_seconds": round(time.time() - fetched_at, 1),
+            "fetched_at": datetime.fromtimestamp(fetched_at, tz=timezone.utc).isoformat(),
+            "stale": stale,
+        }
+        return out
+
+    def get(self) -> Dict[str, Any]:
+        with self._lock:
+            value, fetched_at = self._value, self._fetched_at
+            age = time.time() - fetched_at
+            if value is not None and age < self.ttl:
+                return self._annotate(value, fetched_at, stale=False)
+            if value is not None and age < self.ttl + self.max_stale:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, name=f"refresh-{self.name}", daemon=True).start()
+                return self._annotate(value, fetched_at, stale=True)
+
+        # cold (or expired beyond max_stale): one caller fetches, the rest wait for it
+        with self._fetch_lock:
+            with self._lock:
+                if self._value is not None and time.time() - self._fetched_at < self.ttl:
+                    return self._annotate(self._value, self._fetched_at, stale=False)
+                if self._error is not None and time.time() - self._failed_at < self.ttl:
+                    # the upstream just failed: don't make every caller wait for it again,
+                    # keep serving the last good data if there is any
+                    if self._value is not None:
+                        return self._annotate(self._value, self._fetched_at, stale=True)
+                    raise self._error
+            try:
+                value = self.fetch()
+            except Exception as e:
+                logger.error(f"Fetching {self.name} feed failed: {e}")
+                with self._lock:
+                    self._error, self._failed_at = e, time.time()
+                    if self._value is not None:
+                        # last good data, however old, beats none
+                        return self._annotate(self._value, self._fetched_at, stale=True)
+                raise
+            self._store(value)
+            with self._lock:
+                return self._annotate(self._value, self._fetched_at, stale=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
+            self._fetched_at = 0.0
+            self._error = None
+
+
+def cached_feed(name: str, ttl_env: str, default_ttl: float, fallback: Optional[Callable[[], Dict[str, Any]]] = None):
+    """
+    Decorator that puts a FeedCache in front of a live-feed fetcher.
+    The TTL is read from ttl_env (seconds). The wrapped function keeps its
+    name; .cache exposes the FeedCache and .uncached the raw fetcher.
+    The fetcher raises when the feed is unavailable; fallback() (e.g. mock
+    data) is served only while the cache holds no live value at all, and is
+    never cached.
+    Returned dicts carry a "cache" block with the age of the data and must be
+    treated as read-only.
+    """
+    ttl = float(os.getenv(ttl_env, str(default_ttl)))
+
+    def decorator(fetch: Callable[[], Dict[str, Any]]):
+        cache = FeedCache(name, fetch, ttl)
+
+        @functools.wraps(fetch)
+        def wrapper() -> Dict[str, Any]:
+            try:
+                return cache.get()
+            except Exception as e:
+                if fallback is None:
+                    raise
+                out = dict(fallback())
+                out["cache"] = {"source": name, "stale": True, "fallback": True, "error": str(e)}
+                return out
+
+        wrapper.cache = cache
+        wrapper.uncached = fetch
+        return wrapper
+
+    return decorator
@@ -0,0 +1,178 @@
+"""
+LTA DataMall Traffic Speed Bands ingestion
+Pulls every speed band page concurrently into a columnar segment table
+"""
+import os
+import zlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+LTA_PAGE_SIZE = 500  # DataMall returns at most 500 records per $skip page
+LTA_PAGE_WORKERS = int(os.getenv("LTA_PAGE_WORKERS", "8"))
+LTA_MAX_PAGES = int(os.getenv("LTA_MAX_PAGES", "400"))
+
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_maxsize=LTA_PAGE_WORKERS))
+_session.mount("https://", HTTPAdapter(pool_maxsize=LTA_PAGE_WORKERS))
+
+
+def _fetch_page(url: str, headers: Dict[str, str], skip: int) -> List[Dict[str, Any]]:
+    response = _session.get(url, headers=headers, params={"$skip": skip}, timeout=10)
+    response.raise_for_status()
+    return response.json().get("value", [])
+
+
+def fetch_all_speed_bands(url: str, headers: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Follow LTA $skip paging to the end of the feed.
+    Pages are requested in concurrent waves of LTA_PAGE_WORKERS until a
+    short (or empty) page shows the end has been reached.
+    """
+    records: List[Dict[str, Any]] = []
+    page = 0
+    with ThreadPoolExecutor(max_workers=LTA_PAGE_WORKERS, thread_name_prefix="lta-pages") as pool:
+        while page < LTA_MAX_PAGES:
+            skips = [(page + i) * LTA_PAGE_SIZE for i in range(LTA_PAGE_WORKERS)]
+            pages = list(pool.map(lambda s: _fetch_page(url, headers, s), skips))
+            for values in pages:
+                records.extend(values)
+            if any(len(values) < LTA_PAGE_SIZE for values in pages):
+                break
+            page += LTA_PAGE_WORKERS
+    return records
+
+
+def _parse_coords(item: Dict[str, Any]) -> Optional[Tuple[float, float, float, float]]:
+    """(start_lon, start_lat, end_lon, end_lat) from a speed band record"""
+    try:
+        if "StartLon" in item:
+            return (float(item["StartLon"]), float(item["StartLat"]),
+                    float(item["EndLon"]), float(item["EndLat"]))
+        if "Location" in item:
+            # v1 format: "start_lat start_lon end_lat end_lon"
+            lat1, lon1, lat2, lon2 = (float(v) for v in str(item["Location"]).split())
+            return (lon1, lat1, lon2, lat2)
+    except (TypeError, ValueError, KeyError):
+        pass
+    return None
+
+
+def _placeholder_coords(link_id: str) -> Tuple[float, float, float, float]:
+    # deterministic across processes (unlike hash(), which is salted per run)
+    h = zlib.crc32(str(link_id).encode())
+    lon = 103.85 + (h % 100) / 1000
+    lat = 1.29 + (h % 50) / 1000
+    return (lon, lat, lon + 0.001, lat + 0.001)
+
+
+class SegmentTable:
+    """
+    Columnar store of road segments indexed by LinkID.
+
+    Geometry and road metadata are parsed once, the first time a LinkID is
+    seen; later refreshes only overwrite the speed-band columns in place.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self.index: Dict[str, int] = {}
+        self.link_ids: List[str] = []
+        self.road_names: List[str] = []
+        self.size = 0
+        self.coords = np.zeros((capacity, 4), dtype=np.float64)
+        self.speed_band = np.zeros(capacity, dtype=np.int16)
+        self.min_speed = np.zeros(capacity, dtype=np.float32)
+        self.max_speed = np.zeros(capacity, dtype=np.float32)
+        self.last_seen = np.full(capacity, -1, dtype=np.int64)
+        self.generation = 0
+        self._geometry: List[Dict[str, Any]] = []
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.speed_band)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in ("coords", "speed_band", "min_speed", "max_speed", "last_seen"):
+            old = getattr(self, name)
+            new = np.full((new_capacity,) + old.shape[1:], -1 if name == "last_seen" else 0, dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+
+    def update(self, records: List[Dict[str, Any]]) -> int:
+        """Upsert a full refresh; returns the number of segments in it"""
+        with self._lock:
+            self.generation += 1
+            rows = np.empty(len(records), dtype=np.int64)
+            bands = np.empty(len(records), dtype=np.int16)
+            mins = np.empty(len(records), dtype=np.float32)
+            maxs = np.empty(len(records), dtype=np.float32)
+            for i, item in enumerate(records):
+                link_id = str(item.get("LinkID", ""))
+                row = self.index.get(link_id)
+                if row is None:
+                    row = self._append(link_id, item)
+                rows[i] = row
+                bands[i] = item.get("SpeedBand") or 0
+                mins[i] = float(item.get("MinimumSpeed") or 0)
+                maxs[i] = float(item.get("MaximumSpeed") or 0)
+            self.speed_band[rows] = bands
+            self.min_speed[rows] = mins
+            self.max_speed[rows] = maxs
+            self.last_seen[rows] = self.generation
+            return len(records)
+
+    def _append(self, link_id: str, item: Dict[str, Any]) -> int:
+        row = self.size
+        self._grow(row + 1)
+        coords = _parse_coords(item) or _placeholder_coords(link_id)
+        self.coords[row] = coords
+        self.index[link_id] = row
+        self.link_ids.append(link_id)
+        self.road_names.append(item.get("RoadName", ""))
+        self._geometry.append({
+            "type": "LineString",
+            "coordinates": [[coords[0], coords[1]], [coords[2], coords[3]]]
+        })
+        self.size += 1
+        return row
+
+    def to_geojson(self) -> Dict[str, Any]:
+        """Serialize segments seen in the latest refresh as a GeoJSON FeatureCollection"""
+        with self._lock:
+            rows = np.flatnonzero(self.last_seen[:self.size] == self.generation)
+            bands = self.speed_band[rows].astype(np.float64)
+            speed = np.clip(np.where(bands > 0, bands * 10, 30), 10, 80)
+            level = np.where(speed < 20, 0.8, np.where(speed < 40, 0.5, 0.2))
+            label = np.where(speed < 20, "high", np.where(speed < 40, "moderate", "low"))
+            vehicles = np.clip((200 - speed * 2).astype(np.int64), 50, 300)
+            features = [
+                {
+                    "type": "Feature",
+                    "geometry": self._geometry[row],
+                    "properties": {
+                        "segment_id": row + 1,
+                        "link_id": self.link_ids[row],
+                        "road_name": self.road_names[row],
+                        "speed_band": int(band),
+                        "speed": s,
+                        "avg_speed": s,
+                        "congestion": c,
+                        "congestion_level": l,
+                        "vehicle_count": v,
+                        "volume": v
+                    }
+                }
+                for row, band, s, c, l, v in zip(
+                    rows.tolist(), bands.tolist(), speed.tolist(),
+                    label.tolist(), level.tolist(), vehicles.tolist()
+                )
+            ]
+        return {"type": "FeatureCollection", "features": features}
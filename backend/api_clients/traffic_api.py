@@ -4,16 +4,21 @@ Fetches live traffic data with fallback to mock data
 """
 import os
 import json
-import requests
 from typing import Dict, Any
 import logging
 
+from backend.api_clients.feed_cache import cached_feed
+from backend.api_clients.speed_bands import SegmentTable, fetch_all_speed_bands
+
 logger = logging.getLogger(__name__)
 
 # LTA DataMall API endpoints (corrected)
 LTA_TRAFFIC_SPEED_URL = "http://datamall2.mytransport.sg/ltaodataservice/TrafficSpeedBandsv2"
 LTA_TRAFFIC_INCIDENTS_URL = "http://datamall2.mytransport.sg/ltaodataservice/TrafficIncidents"
 
+# Process-wide segment table, kept across refreshes
+_segments = SegmentTable()
+
 def _create_default_traffic_geojson() -> Dict[str, Any]:
     """Create default valid GeoJSON for Singapore"""
     return {
@@ -111,92 +116,26 @@ def _load_mock_data() -> Dict[str, Any]:
     
     return _create_default_traffic_geojson()
 
-def _convert_lta_to_geojson(lta_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Convert LTA DataMall response to GeoJSON"""
-    features = []
-    
-    if "value" in lta_data:
-        for idx, item in enumerate(lta_data["value"][:20]):
-            link_id = item.get("LinkID", "")
-            speed_band = item.get("SpeedBand", 0)
-            
-            speed = max(10, min(80, speed_band * 10 if speed_band > 0 else 30))
-            
-            if speed < 20:
-                congestion = "high"
-                congestion_level = 0.8
-            elif speed < 40:
-                congestion = "moderate"
-                congestion_level = 0.5
-            else:
-                congestion = "low"
-                congestion_level = 0.2
-            
-            vehicle_count = max(50, min(300, int(200 - (speed * 2))))
-            
-            base_lon = 103.85 + (hash(link_id) % 100) / 1000
-            base_lat = 1.29 + (hash(link_id) % 50) / 1000
-            
-            features.append({
-                "type": "Feature",
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": [
-                        [base_lon, base_lat],
-                        [base_lon + 0.001, base_lat + 0.001],
-                        [base_lon + 0.002, base_lat + 0.002]
-                    ]
-                },
-                "properties": {
-                    "segment_id": idx + 1,
-                    "link_id": link_id,
-                    "speed": float(speed),
-                    "avg_speed": float(speed),
-                    "congestion": congestion,
-                    "congestion_level": float(congestion_level),
-                    "vehicle_count": int(vehicle_count),
-                    "volume": int(vehicle_count)
-                }
-            })
-    
-    if not features:
-        return _create_default_traffic_geojson()
-    
-    return {
-        "type": "FeatureCollection",
-        "features": features
-    }
-
+@cached_feed("traffic", "TRAFFIC_CACHE_TTL", default_ttl=60, fallback=_load_mock_data)
 def fetch_live_traffic() -> Dict[str, Any]:
-    """Fetch live traffic data from LTA DataMall API"""
+    """Fetch live traffic data from LTA DataMall API (raises if unavailable; the cache falls back to mock data)"""
     api_key = os.getenv("LTA_API_KEY")
     
     if not api_key:
-        logger.warning("LTA_API_KEY not found, using mock data")
-        return _load_mock_data()
+        raise RuntimeError("LTA_API_KEY not found")
     
-    try:
-        headers = {
-            "AccountKey": api_key,
-            "accept": "application/json"
-        }
-        
-        response = requests.get(
-            LTA_TRAFFIC_SPEED_URL,
-            headers=headers,
-            timeout=10
-        )
-        response.raise_for_status()
-        
-        lta_data = response.json()
-        geojson_data = _convert_lta_to_geojson(lta_data)
-        
-        if not geojson_data.get("features"):
-            logger.warning("No features in LTA response, using mock data")
-            return _load_mock_data()
-        
-        return geojson_data
-        
-    except Exception as e:
-        logger.error(f"Error fetching LTA traffic data: {e}", exc_info=True)
-        return _load_mock_data()
+    headers = {
+        "AccountKey": api_key,
+        "accept": "application/json"
+    }
+    
+    # Full network: every $skip page, fetched concurrently; only speed
+    # columns of already-known segments are updated in place
+    records = fetch_all_speed_bands(LTA_TRAFFIC_SPEED_URL, headers)
+    _segments.update(records)
+    geojson_data = _segments.to_geojson()
+    
+    if not geojson_data.get("features"):
+        raise RuntimeError("No features in LTA response")
+    
+    return geojson_data
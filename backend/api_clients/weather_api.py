@@ -5,9 +5,13 @@ Fetches live weather data
 import os
 import json
 import requests
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, List
 import logging
 
+from backend.api_clients.feed_cache import cached_feed
+
 logger = logging.getLogger(__name__)
 
 # data.gov.sg Current Weather API
@@ -17,6 +21,20 @@ DATA_GOV_SG_RELATIVE_HUMIDITY_URL = "https://api.data.gov.sg/v1/environment/rela
 DATA_GOV_SG_WIND_SPEED_URL = "https://api.data.gov.sg/v1/environment/wind-speed"
 DATA_GOV_SG_RAINFALL_URL = "https://api.data.gov.sg/v1/environment/rainfall"
 
+# field -> station endpoint; all four are fetched concurrently
+WEATHER_ENDPOINTS = {
+    "temperature": DATA_GOV_SG_AIR_TEMP_URL,
+    "humidity": DATA_GOV_SG_RELATIVE_HUMIDITY_URL,
+    "wind_speed": DATA_GOV_SG_WIND_SPEED_URL,
+    "rainfall": DATA_GOV_SG_RAINFALL_URL,
+}
+WEATHER_DEADLINE = float(os.getenv("WEATHER_DEADLINE", "5"))
+
+# Pooled keep-alive session shared by the fan-out workers
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=len(WEATHER_ENDPOINTS)))
+_executor = ThreadPoolExecutor(max_workers=len(WEATHER_ENDPOINTS), thread_name_prefix="weather")
+
 
 def _load_mock_weather() -> Dict[str, Any]:
     """Load mock weather data"""
@@ -32,72 +50,85 @@ def _load_mock_weather() -> Dict[str, Any]:
     }
 
 
+def _fetch_station_readings(url: str) -> List[Dict[str, Any]]:
+    """Fetch one data.gov.sg endpoint and return every station reading with its location"""
+    response = _session.get(url, timeout=WEATHER_DEADLINE)
+    response.raise_for_status()
+    data = response.json()
+    stations = {
+        st.get("id"): st for st in data.get("metadata", {}).get("stations", [])
+    }
+    items = data.get("items") or [{}]
+    readings = []
+    for reading in items[0].get("readings", []):
+        value = reading.get("value")
+        if value is None:
+            continue
+        station = stations.get(reading.get("station_id"), {})
+        location = station.get("location", {})
+        readings.append({
+            "station_id": reading.get("station_id"),
+            "name": station.get("name"),
+            "lat": location.get("latitude"),
+            "lon": location.get("longitude"),
+            "value": float(value)
+        })
+    return readings
+
+
+@cached_feed("weather", "WEATHER_CACHE_TTL", default_ttl=120, fallback=_load_mock_weather)
 def fetch_live_weather() -> Dict[str, Any]:
-    """Fetch live weather data from data.gov.sg"""
-    try:
-        # Get air temperature
-        temp = 28.0
-        try:
-            response = requests.get(DATA_GOV_SG_AIR_TEMP_URL, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                if "items" in data and len(data["items"]) > 0:
-                    readings = data["items"][0].get("readings", [])
-                    if readings:
-                        temp = readings[0].get("value", 28.0)
-        except:
-            pass
-        
-        # Get humidity
-        humidity = 75.0
-        try:
-            response = requests.get(DATA_GOV_SG_RELATIVE_HUMIDITY_URL, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                if "items" in data and len(data["items"]) > 0:
-                    readings = data["items"][0].get("readings", [])
-                    if readings:
-                        humidity = readings[0].get("value", 75.0)
-        except:
-            pass
-        
-        # Get wind speed
-        wind_speed = 15.0
-        try:
-            response = requests.get(DATA_GOV_SG_WIND_SPEED_URL, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                if "items" in data and len(data["items"]) > 0:
-                    readings = data["items"][0].get("readings", [])
-                    if readings:
-                        wind_speed = readings[0].get("value", 15.0)
-        except:
-            pass
-        
-        # Get rainfall
-        rainfall = 0.0
-        try:
-            response = requests.get(DATA_GOV_SG_RAINFALL_URL, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                if "items" in data and len(data["items"]) > 0:
-                    readings = data["items"][0].get("readings", [])
-                    if readings:
-                        rainfall = readings[0].get("value", 0.0)
-        except:
-            pass
-        
-        return {
-            "temp": round(temp, 1),
-            "temperature": round(temp, 1),
-            "humidity": round(humidity, 1),
-            "wind_speed": round(wind_speed, 1),
-            "rainfall": round(rainfall, 1),
-            "description": "Current weather",
-            "city": "Singapore",
-            "source": "live"
-        }
-        
-    except Exception as e:
-        logger.error(f"Error fetching weather data: {e}", exc_info=True)
-        return _load_mock_weather()
+    """
+    Fetch live weather data from data.gov.sg
+
+    The four station endpoints are queried concurrently over a pooled session
+    under one overall deadline (WEATHER_DEADLINE). Fields that fail or miss
+    the deadline fall back to the mock values; if none answers this raises
+    and the cache serves the last good reading (or mock data). Scalar fields
+    are the mean over stations; every station reading is returned under "stations".
+    """
+    mock = _load_mock_weather()
+    futures = {
+        field: _executor.submit(_fetch_station_readings, url)
+        for field, url in WEATHER_ENDPOINTS.items()
+    }
+    done, _ = wait(futures.values(), timeout=WEATHER_DEADLINE)
+
+    values = {}
+    stations = {}
+    for field, future in futures.items():
+        readings = []
+        if future in done:
+            try:
+                readings = future.result()
+            except Exception as e:
+                logger.warning(f"data.gov.sg {field} fetch failed: {e}")
+        else:
+            future.cancel()
+            logger.warning(f"data.gov.sg {field} missed the {WEATHER_DEADLINE}s deadline, using mock")
+        stations[field] = readings
+        if readings:
+            values[field] = sum(r["value"] for r in readings) / len(readings)
+        else:
+            values[field] = mock[field]
+
+    live = [field for field in WEATHER_ENDPOINTS if stations[field]]
+    if not live:
+        raise RuntimeError("no data.gov.sg weather endpoint answered")
+    if len(live) == len(WEATHER_ENDPOINTS):
+        source = "live"
+    else:
+        source = "partial"
+
+    return {
+        "temp": round(values["temperature"], 1),
+        "temperature": round(values["temperature"], 1),
+        "humidity": round(values["humidity"], 1),
+        "wind_speed": round(values["wind_speed"], 1),
+        "rainfall": round(values["rainfall"], 1),
+        "description": "Current weather",
+        "city": "Singapore",
+        "source": source,
+        "live_fields": live,
+        "stations": stations
+    }
@@ -66,6 +66,17 @@ def check_lta() -> None:
         logger.error("LTA check failed: %s", exc, exc_info=True)
 
 
+def check_embedding_profiles() -> None:
+    # builds every MobileNet embedding profile (downloads the pretrained weights on first run)
+    from gnn_pipeline.image_features import check_profiles
+
+    for name, error in check_profiles().items():
+        if error:
+            logger.error("Embedding profile %s does not build: %s", name, error)
+        else:
+            logger.info("Embedding profile %s OK", name)
+
+
 if __name__ == "__main__":
     # Ensure .env is loaded the same way as in main.py
     load_dotenv()
@@ -74,3 +85,4 @@ if __name__ == "__main__":
     print_env_info()
     check_waqi()
     check_lta()
+    check_embedding_profiles()
@@ -0,0 +1,203 @@
+# backend/gnn_pipeline/batching.py
+import asyncio
+import logging
+import os
+import threading
+import time
+import numpy as np
+from .feature_cache import extract_features_cached
+from .image_features import EMBEDDING_DIM
+from .inference import predict_for_snapshot, predict_snapshots
+from .model_executor import model_executor
+
+logger = logging.getLogger("batching")
+
+# Concurrent /predict requests are merged into shared model batches: a job waits at
+# most BATCH_MAX_WAIT_MS for others to join, and a batch holds at most
+# BATCH_MAX_IMAGES images (extraction) or BATCH_MAX_GRAPHS snapshots (GNN).
+PREDICT_BATCHING = os.getenv("PREDICT_BATCHING", "1") == "1"
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "128"))
+BATCH_MAX_GRAPHS = int(os.getenv("BATCH_MAX_GRAPHS", "32"))
+
+
+class MicroBatcher:
+    """
+    Coalesces jobs from concurrent requests into shared batches.
+
+    A job is a list of items; fn(items) runs on the model executor over the items of
+    every job in the batch and returns one result per item, which are handed
+    back to each job's future in order. A job is never split across batches.
+    """
+
+    def __init__(self, name, fn, max_items, max_wait_ms=BATCH_MAX_WAIT_MS, executor=model_executor):
+        self.name = name
+        self.fn = fn
+        self.max_items = max_items
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        # the queue and worker task belong to the event loop of the first submit
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._carry = None  # job that did not fit the previous batch
+        self._stats_lock = threading.Lock()
+        self.jobs = 0
+        self.batches = 0
+        self.items = 0
+        self.max_batch_items = 0
+        self.max_queue_depth = 0
+        self.wait_s = 0.0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._carry = None
+            self._worker = loop.create_task(self._run())
+
+    def queue_depth(self):
+        return (self._queue.qsize() if self._queue is not None else 0) + (self._carry is not None)
+
+    async def submit(self, items):
+        items = list(items)
+        if not items:
+            return []
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((items, future, time.perf_counter()))
+        with self._stats_lock:
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth())
+        return await future
+
+    async def _next_job(self, timeout):
+        # None once the wait window closes; cancelling a pending get leaves the queue untouched
+        if not self._queue.empty():
+            return self._queue.get_nowait()
+        if timeout <= 0:
+            return None
+        getter = asyncio.ensure_future(self._queue.get())
+        done, _ = await asyncio.wait({getter}, timeout=timeout)
+        if not done:
+            getter.cancel()
+            return None
+        return getter.result()
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        if self._carry is not None:
+            batch, self._carry = [self._carry], None
+        else:
+            batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while size < self.max_items:
+            job = await self._next_job(deadline - loop.time())
+            if job is None:
+                break
+            if size + len(job[0]) > self.max_items:
+                self._carry = job
+                break
+            batch.append(job)
+            size += len(job[0])
+        return batch, size
+
+    async def _run(self):
+        while True:
+            batch, size = await self._collect()
+            started = time.perf_counter()
+            with self._stats_lock:
+                self.jobs += len(batch)
+                self.batches += 1
+                self.items += size
+                self.max_batch_items = max(self.max_batch_items, size)
+                self.wait_s += sum(started - queued for _, _, queued in batch)
+            items = [item for job_items, _, _ in batch for item in job_items]
+            try:
+                results = await self.executor.run(self.fn, items)
+            except Exception as e:
+                if len(batch) == 1:
+                    self._resolve(batch[0][1], error=e)
+                    continue
+                # one bad job (e.g. a corrupt image) must not fail the requests it was batched with
+                logger.warning("%s batch of %d jobs failed (%s); retrying them one by one", self.name, len(batch), e)
+                for job_items, future, _ in batch:
+                    try:
+                        self._resolve(future, await self.executor.run(self.fn, job_items))
+                    except Exception as job_error:
+                        self._resolve(future, error=job_error)
+                continue
+            start = 0
+            for job_items, future, _ in batch:
+                self._resolve(future, results[start:start + len(job_items)])
+                start += len(job_items)
+
+    @staticmethod
+    def _resolve(future, result=None, error=None):
+        if future.done():  # the client may have gone away
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self.queue_depth(),
+                "max_queue_depth": self.max_queue_depth,
+                "jobs": self.jobs,
+                "batches": self.batches,
+                "items": self.items,
+                "max_batch_items": self.max_batch_items,
+                "mean_batch_items": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "mean_jobs_per_batch": round(self.jobs / self.batches, 2) if self.batches else 0.0,
+                "mean_wait_ms": round(1000 * self.wait_s / self.jobs, 2) if self.jobs else 0.0,
+            }
+
+
+def _extract_items(items):
+    # items: (image, fast_key) pairs -> [(vehicle_count, embedding)]
+    counts, embeddings = extract_features_cached([img for img, _ in items], fast_keys=[key for _, key in items])
+    return list(zip(counts, embeddings))
+
+
+feature_batcher = MicroBatcher("features", _extract_items, BATCH_MAX_IMAGES)
+gnn_batcher = MicroBatcher("gnn", predict_snapshots, BATCH_MAX_GRAPHS)
+
+
+async def extract_features_coalesced(images, fast_keys):
+    """Async extract_features_cached whose misses share extractor batches with concurrent requests"""
+    if not PREDICT_BATCHING:
+        return await model_executor.run(extract_features_cached, images, fast_keys=fast_keys)
+    results = await feature_batcher.submit(zip(images, fast_keys))
+    counts = np.array([vc for vc, _ in results], dtype=np.int64)
+    embeddings = np.stack([emb for _, emb in results]) if results else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    return counts, embeddings
+
+
+async def predict_snapshot_coalesced(camera_dicts):
+    """Async predict_for_snapshot whose GNN forward is batched with concurrent requests"""
+    if not PREDICT_BATCHING:
+        return await model_executor.run(predict_for_snapshot, camera_dicts)
+    return (await gnn_batcher.submit([camera_dicts]))[0]
+
+
+def batching_stats():
+    return {
+        "enabled": PREDICT_BATCHING,
+        "max_wait_ms": BATCH_MAX_WAIT_MS,
+        "features": feature_batcher.stats(),
+        "gnn": gnn_batcher.stats(),
+    }
+
+
+def close():
+    feature_batcher.close()
+    gnn_batcher.close()
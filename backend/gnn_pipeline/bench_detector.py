@@ -0,0 +1,70 @@
+# backend/gnn_pipeline/bench_detector.py
+import os
+import json
+import time
+import argparse
+import numpy as np
+from image_features import _load_image, _shrink, _count_with_yolo, get_yolo, YOLO_AVAILABLE
+from snapshot_store import SnapshotStore
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("bench_detector")
+
+DATA_DIR = os.getenv("DOWNLOAD_DIR", "./data/images")
+
+def benchmark(frames, sizes=(320, 480, 640), batch_size=16, repeats=2):
+    """
+    Vehicle counts and latency of the batched detector at each imgsz.
+    frames: decoded PIL images. Counts are compared against the largest size.
+    """
+    per_size = {}
+    for imgsz in sizes:
+        shrunk = [_shrink(f, imgsz) for f in frames]
+        _count_with_yolo(shrunk[:batch_size], imgsz=imgsz)  # warm-up at this size
+        best = float("inf")
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            counts = np.concatenate([_count_with_yolo(shrunk[i:i + batch_size], imgsz=imgsz)
+                                     for i in range(0, len(shrunk), batch_size)])
+            best = min(best, time.perf_counter() - t0)
+        per_size[imgsz] = (counts, best)
+    ref_counts = per_size[max(sizes)][0]
+    report = []
+    for imgsz in sizes:
+        counts, elapsed = per_size[imgsz]
+        report.append({
+            "imgsz": imgsz,
+            "ms_per_image": round(1000 * elapsed / len(frames), 2),
+            "images_per_s": round(len(frames) / elapsed, 1),
+            "mean_count": round(float(counts.mean()), 2),
+            "mean_abs_diff_vs_ref": round(float(np.abs(counts - ref_counts).mean()), 2),
+            "corr_vs_ref": round(float(np.corrcoef(counts, ref_counts)[0, 1]), 3) if counts.std() and ref_counts.std() else None,
+        })
+    return report
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Compare YOLO vehicle counts and latency across input sizes on the archive")
+    ap.add_argument("--sizes", default="320,480,640")
+    ap.add_argument("--images", type=int, default=128, help="distinct archived frames to sample")
+    ap.add_argument("--batch-size", type=int, default=16)
+    ap.add_argument("--report", help="also write the results as JSON to this path")
+    args = ap.parse_args()
+    if not YOLO_AVAILABLE or get_yolo() is None:
+        raise SystemExit("ultralytics/YOLO is not available; nothing to benchmark")
+    store = SnapshotStore()
+    store.ingest_directory(DATA_DIR)
+    snaps = store.query()
+    _, first = np.unique(snaps["content_hash"].astype(str), return_index=True)
+    pick = np.random.default_rng(0).permutation(first)[:args.images]
+    # decode once up front so the timings cover detection only
+    frames = [_load_image(p) for p in snaps["path"][pick]]
+    sizes = tuple(int(s) for s in args.sizes.split(","))
+    report = benchmark(frames, sizes=sizes, batch_size=args.batch_size)
+    for r in report:
+        logger.info("imgsz=%d: %.2f ms/img (%.1f img/s), mean count %.2f, |diff| vs %d = %.2f, corr %s",
+                    r["imgsz"], r["ms_per_image"], r["images_per_s"], r["mean_count"],
+                    max(sizes), r["mean_abs_diff_vs_ref"], r["corr_vs_ref"])
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
@@ -1,17 +1,131 @@
 # backend/gnn_pipeline/dataset.py
+import bisect
+import json
+import os
+from pathlib import Path
+import numpy as np
 import torch
-from .torch_geometric.data import Data, InMemoryDataset
+from torch_geometric.data import Data, Dataset
 
-class TrafficGraphDataset(InMemoryDataset):
+class TrafficGraphDataset(Dataset):
     def __init__(self, graphs_list, transform=None):
-        # graphs_list: list of tuples (x, edge_index, y) where y is congestion label for nodes or graph-level
+        # graphs_list: Data objects, or tuples (x, edge_index, y) where y is congestion label for nodes or graph-level
+        # kept as a plain list: the DataLoader collates per batch, so no second collated copy is held
         super().__init__(None, transform)
         self.data_list = []
-        for x, edge_index, y in graphs_list:
-            data = Data(x=x, edge_index=edge_index, y=y)
+        for g in graphs_list:
+            data = g if isinstance(g, Data) else Data(x=g[0], edge_index=g[1], y=g[2])
             self.data_list.append(data)
-        self.data, self.slices = self.collate(self.data_list)
-    def __len__(self):
+    def len(self):
         return len(self.data_list)
     def get(self, idx):
         return self.data_list[idx]
+
+
+def _save_npy(path, array):
+    tmp = path.with_name(path.name + ".part")
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+def write_graph_shards(root, graphs, edge_index, embeddings_path, meta=None, shard_size=1024):
+    """
+    Write snapshot graphs to root as fixed-size shards and return the number written.
+
+    graphs yields (ts_epoch, node_scalars [N,5], embedding_offsets [N], y) with
+    the same node order as edge_index. Node embeddings are not copied: shards
+    keep offsets into the snapshot store's embeddings.npy, so a graph costs
+    N*(5*4+8) bytes on disk. meta.json is written last and marks the shards
+    complete.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    if (root / "meta.json").exists():
+        os.remove(root / "meta.json")
+    for old in root.glob("shard_*.npy"):
+        os.remove(old)
+    shard_sizes = []
+    buf = []
+
+    def flush():
+        k = len(shard_sizes)
+        ts, scalars, offsets, y = zip(*buf)
+        _save_npy(root / f"shard_{k:05d}.t.npy", np.asarray(ts, dtype=np.float64))
+        _save_npy(root / f"shard_{k:05d}.scalars.npy", np.stack(scalars).astype(np.float32))
+        _save_npy(root / f"shard_{k:05d}.offsets.npy", np.stack(offsets).astype(np.int64))
+        _save_npy(root / f"shard_{k:05d}.y.npy", np.asarray(y, dtype=np.float32))
+        shard_sizes.append(len(buf))
+        buf.clear()
+
+    for g in graphs:
+        buf.append(g)
+        if len(buf) >= shard_size:
+            flush()
+    if buf:
+        flush()
+    _save_npy(root / "edge_index.npy", np.asarray(edge_index, dtype=np.int64))
+    meta = dict(meta or {}, shard_sizes=shard_sizes, embeddings_path=str(Path(embeddings_path).resolve()))
+    tmp = root / "meta.json.part"
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, root / "meta.json")
+    return sum(shard_sizes)
+
+def read_shard_meta(root):
+    path = Path(root) / "meta.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+class ShardedGraphDataset(Dataset):
+    """
+    Out-of-core snapshot graphs written by write_graph_shards.
+
+    Shards and the embedding matrix are memory-mapped lazily in whichever
+    process reads them (so each DataLoader worker maps its own copy) and a
+    graph's features are assembled only when it is requested. Resident memory
+    is set by the batch size and prefetch depth, not the length of the history.
+    """
+
+    def __init__(self, root, transform=None):
+        super().__init__(None, transform)
+        self.shard_root = Path(root)
+        meta = read_shard_meta(root)
+        if meta is None:
+            raise FileNotFoundError(f"no complete graph shards in {root}")
+        self.meta = meta
+        self.shard_sizes = meta["shard_sizes"]
+        self.starts = np.concatenate([[0], np.cumsum(self.shard_sizes)]).tolist()
+        self.edge_index = torch.from_numpy(np.load(self.shard_root / "edge_index.npy"))
+        self._shards = {}
+        self._embeddings = None
+        self._pid = None
+
+    def _maps(self, k):
+        if self._pid != os.getpid():
+            # fresh maps after fork: never share file handles with the parent
+            self._shards, self._embeddings, self._pid = {}, None, os.getpid()
+        if self._embeddings is None:
+            self._embeddings = np.load(self.meta["embeddings_path"], mmap_mode="r")
+        shard = self._shards.get(k)
+        if shard is None:
+            shard = {
+                name: np.load(self.shard_root / f"shard_{k:05d}.{name}.npy", mmap_mode="r")
+                for name in ("scalars", "offsets", "y")
+            }
+            self._shards[k] = shard
+        return shard
+
+    def len(self):
+        return self.starts[-1]
+
+    def get(self, idx):
+        k = bisect.bisect_right(self.starts, idx) - 1
+        i = idx - self.starts[k]
+        shard = self._maps(k)
+        scalars = shard["scalars"][i]
+        x = np.empty((scalars.shape[0], scalars.shape[1] + self._embeddings.shape[1]), dtype=np.float32)
+        x[:, :scalars.shape[1]] = scalars
+        x[:, scalars.shape[1]:] = self._embeddings[shard["offsets"][i]]
+        y = torch.tensor([float(shard["y"][i])], dtype=torch.float)
+        return Data(x=torch.from_numpy(x), edge_index=self.edge_index, y=y)
@@ -1,12 +1,19 @@
 # backend/gnn_pipeline/download_images.py
 import os
+import json
+import hashlib
 import time
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import datetime
+import numpy as np
 import logging
+from snapshot_store import SnapshotStore
 
 load_dotenv(dotenv_path=Path(__file__).resolve().parents[1] / ".env")
 
@@ -14,54 +21,189 @@ LTA_KEY = os.getenv("LTA_ACCOUNT_KEY")
 CAMERA_FEED_URL = os.getenv("CAMERA_LIST_URL") or "https://datamall2.mytransport.sg/ltaodataservice/Traffic-Imagesv2"
 DOWNLOAD_DIR = Path(os.getenv("DOWNLOAD_DIR", "./data/images"))
 DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "16"))
+DOWNLOAD_INTERVAL = int(os.getenv("DOWNLOAD_INTERVAL", "60"))
+# DOWNLOAD_EMBED=1: run the batched extractor on new images right after each poll
+DOWNLOAD_EMBED = os.getenv("DOWNLOAD_EMBED", "0") == "1"
+MANIFEST_PATH = DOWNLOAD_DIR / "manifest.jsonl"
 
 HEADERS = {"AccountKey": LTA_KEY, "accept": "application/json"}
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("downloader")
 
+# one keep-alive pool shared by all download workers
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_maxsize=DOWNLOAD_WORKERS))
+_session.mount("http://", HTTPAdapter(pool_maxsize=DOWNLOAD_WORKERS))
+
+# camera_id -> {"timestamp", "etag"} of the last image written for that camera
+_last_seen = {}
+_last_seen_lock = threading.Lock()
+
 def fetch_camera_list():
-    resp = requests.get(CAMERA_FEED_URL, headers=HEADERS, timeout=15)
+    resp = _session.get(CAMERA_FEED_URL, headers=HEADERS, timeout=15)
     resp.raise_for_status()
     return resp.json().get("value") or resp.json()
 
-def download_image(camera):
+def _camera_fields(camera):
     img_url = camera.get("ImageLink") or camera.get("image")
     cam_id = camera.get("CameraID") or camera.get("camera_id") or camera.get("cameraId")
     timestamp = camera.get("Timestamp") or camera.get("timestamp") or datetime.utcnow().isoformat()
+    return img_url, cam_id, timestamp
+
+def _atomic_write(path, data):
+    # write to a sibling temp file and rename so readers never see a partial JPEG
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.part")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def fetch_image(camera):
+    """
+    Download one camera image unless it is already on disk.
+    Returns a result dict with status saved | unchanged | not_modified | failed | no_link,
+    plus path, bytes, latency_s and (for saved images) the raw content.
+    """
+    img_url, cam_id, timestamp = _camera_fields(camera)
+    result = {"camera_id": cam_id, "timestamp": timestamp, "status": "failed", "path": None}
     if not img_url:
         logger.warning("no image link for camera %s", cam_id)
-        return None
+        result["status"] = "no_link"
+        return result
+    with _last_seen_lock:
+        seen = _last_seen.get(cam_id)
+    if seen and seen["timestamp"] == timestamp:
+        # LTA has not published a new frame for this camera since the last poll
+        result["status"] = "unchanged"
+        return result
     # filename: camera_timestamp.jpg
     safe_ts = timestamp.replace(":", "-").replace(" ", "_")
     fn = DOWNLOAD_DIR / f"{cam_id}_{safe_ts}.jpg"
+    if fn.exists():
+        # written by an earlier run (writes are atomic, so the file is complete)
+        with _last_seen_lock:
+            _last_seen[cam_id] = {"timestamp": timestamp, "etag": (seen or {}).get("etag")}
+        result["status"] = "unchanged"
+        return result
+    headers = {}
+    if seen and seen.get("etag"):
+        headers["If-None-Match"] = seen["etag"]
+    t0 = time.perf_counter()
     try:
-        r = requests.get(img_url, stream=True, timeout=20)
-        r.raise_for_status()
-        with open(fn, "wb") as f:
-            for chunk in r.iter_content(1024*64):
-                f.write(chunk)
-        logger.info("Downloaded %s -> %s", cam_id, fn)
-        return str(fn)
+        r = _session.get(img_url, headers=headers, timeout=20)
+        result["latency_s"] = round(time.perf_counter() - t0, 4)
+        if r.status_code == 304:
+            result["status"] = "not_modified"
+        else:
+            r.raise_for_status()
+            _atomic_write(fn, r.content)
+            result.update(status="saved", path=str(fn), bytes=len(r.content), content=r.content)
+            logger.info("Downloaded %s -> %s", cam_id, fn)
+        with _last_seen_lock:
+            _last_seen[cam_id] = {"timestamp": timestamp, "etag": r.headers.get("ETag") or (seen or {}).get("etag")}
     except Exception as e:
+        result["latency_s"] = round(time.perf_counter() - t0, 4)
         logger.exception("download failed for %s: %s", img_url, e)
-        return None
+    return result
+
+def download_image(camera):
+    # single-camera helper kept for callers that only need the saved path
+    return fetch_image(camera).get("path")
+
+_store = None
 
-def run_once(save_meta=True):
+def get_store():
+    global _store
+    if _store is None:
+        _store = SnapshotStore()
+    return _store
+
+def _register_saved(cameras, results):
+    # index the new frames (with feed lat/lon and content hash) in the snapshot store
+    saved = [(cam, r) for cam, r in zip(cameras, results) if r["status"] == "saved"]
+    if not saved:
+        return
+    ids = get_store().add_many([{
+        "camera_id": r["camera_id"],
+        "timestamp": r["timestamp"],
+        "path": r["path"],
+        "content_hash": hashlib.blake2b(r["content"], digest_size=20).hexdigest(),
+        "latitude": cam.get("Latitude"),
+        "longitude": cam.get("Longitude"),
+    } for cam, r in saved])
+    for (_, r), snapshot_id in zip(saved, ids):
+        r["snapshot_id"] = snapshot_id
+
+def _embed_saved(results):
+    # compute (vehicle_count, embedding) for the new frames while their bytes are in memory
+    from image_features import extract_features_batch, profile_signature, EMBEDDING_DIM
+    saved = [r for r in results if r["status"] == "saved" and "snapshot_id" in r]
+    if not saved:
+        return
+    get_store().check_profile(profile_signature(), EMBEDDING_DIM)
+    counts, embeddings = extract_features_batch([r["content"] for r in saved])
+    get_store().set_features([r["snapshot_id"] for r in saved], counts, embeddings)
+    for r, vc in zip(saved, counts):
+        r["vehicle_count"] = int(vc)
+
+def _latency_stats(results):
+    lat = np.array([r["latency_s"] for r in results if "latency_s" in r], dtype=np.float64)
+    if lat.size == 0:
+        return {}
+    return {
+        "mean_s": round(float(lat.mean()), 4),
+        "p50_s": round(float(np.percentile(lat, 50)), 4),
+        "p95_s": round(float(np.percentile(lat, 95)), 4),
+        "max_s": round(float(lat.max()), 4),
+    }
+
+def run_once(save_meta=True, embed=DOWNLOAD_EMBED):
+    started = datetime.utcnow().isoformat()
+    t0 = time.perf_counter()
     cameras = fetch_camera_list()
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download") as pool:
+        results = list(pool.map(fetch_image, cameras))
+    try:
+        _register_saved(cameras, results)
+    except Exception as e:
+        logger.exception("snapshot store update failed: %s", e)
+    if embed:
+        try:
+            _embed_saved(results)
+        except Exception as e:
+            logger.exception("inline embedding failed: %s", e)
+    status_counts = {}
+    for r in results:
+        status_counts[r["status"]] = status_counts.get(r["status"], 0) + 1
+    manifest = {
+        "poll_started": started,
+        "duration_s": round(time.perf_counter() - t0, 3),
+        "cameras": len(cameras),
+        "status": status_counts,
+        "latency": _latency_stats(results),
+        "files": [
+            {k: r[k] for k in ("camera_id", "snapshot_id", "timestamp", "path", "bytes", "latency_s", "vehicle_count") if k in r}
+            for r in results if r["status"] == "saved"
+        ],
+    }
+    logger.info("poll done in %.2fs: %s latency=%s", manifest["duration_s"], status_counts, manifest["latency"])
+    if save_meta:
+        with open(MANIFEST_PATH, "a") as f:
+            f.write(json.dumps(manifest) + "\n")
     saved = []
-    for cam in cameras:
-        filepath = download_image(cam)
-        if filepath:
-            saved.append({"camera": cam, "path": filepath})
+    for cam, r in zip(cameras, results):
+        if r["status"] == "saved":
+            saved.append({"camera": cam, "path": r["path"]})
     return saved
 
 if __name__ == "__main__":
-    # simple scheduler: fetch every minute
-    interval = 60
+    # simple scheduler: fetch every DOWNLOAD_INTERVAL seconds (default one minute)
+    interval = DOWNLOAD_INTERVAL
     while True:
+        started = time.monotonic()
         try:
             run_once()
         except Exception as e:
             logger.exception("error in downloader loop: %s", e)
-        time.sleep(interval)
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
@@ -0,0 +1,145 @@
+# backend/gnn_pipeline/export.py
+import os
+import copy
+import json
+import time
+import hashlib
+import argparse
+import pathlib
+from datetime import datetime
+import numpy as np
+import torch
+from torch_geometric.loader import DataLoader
+from torch_geometric.nn.dense.linear import Linear as PygLinear
+from model import GraphSageNet
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("export")
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent  # backend/
+# same resolution as inference.MODEL_PATH / inference.EXPORT_PATH
+MODEL_PATH = os.getenv("GNN_MODEL_PATH", str(ROOT / "gnn_model.pt"))
+EXPORT_PATH = os.getenv("GNN_EXPORT_PATH", str(ROOT / "gnn_model.ts"))
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_eager(weights_path=MODEL_PATH):
+    # rebuild GraphSageNet with the layer sizes recorded in the state dict
+    state = torch.load(weights_path, map_location="cpu")
+    hidden, in_channels = state["convs.0.lin_l.weight"].shape
+    model = GraphSageNet(in_channels, hidden_channels=hidden)
+    model.load_state_dict(state)
+    model.eval()
+    return model
+
+def _plain_linears(module):
+    # SAGEConv projects through PyG's own Linear, which quantize_dynamic does not
+    # recognise; swap in numerically identical torch.nn.Linear layers
+    for name, child in module.named_children():
+        if isinstance(child, PygLinear):
+            lin = torch.nn.Linear(child.in_channels, child.out_channels, bias=child.bias is not None)
+            with torch.no_grad():
+                lin.weight.copy_(child.weight)
+                if child.bias is not None:
+                    lin.bias.copy_(child.bias)
+            setattr(module, name, lin)
+        else:
+            _plain_linears(child)
+    return module
+
+def export_model(weights_path=MODEL_PATH, out_path=EXPORT_PATH, quantize=False):
+    """
+    Script the trained model to a TorchScript artifact that serving loads
+    instead of the eager module. quantize=True converts every linear layer
+    (both SAGEConv projections and the MLP head) to dynamic int8.
+    Returns (eager model, exported module).
+    """
+    eager = load_eager(weights_path)
+    model = copy.deepcopy(eager)
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(_plain_linears(model), {torch.nn.Linear}, dtype=torch.qint8)
+    scripted = torch.jit.script(model)
+    meta = {
+        "source": os.path.abspath(weights_path),
+        "source_sha256": _sha256(weights_path),
+        "in_channels": eager.convs[0].in_channels,
+        "hidden_channels": eager.convs[0].out_channels,
+        "quantized": quantize,
+        "torch": torch.__version__,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    out_path = os.path.abspath(out_path)
+    tmp = f"{out_path}.{os.getpid()}.part"
+    torch.jit.save(scripted, tmp, _extra_files={"meta.json": json.dumps(meta)})
+    # atomic publish: the serving registry never reads a partial artifact
+    os.replace(tmp, out_path)
+    logger.info("Exported %s -> %s (quantized=%s)", weights_path, out_path, quantize)
+    return eager, torch.jit.load(out_path)
+
+@torch.inference_mode()
+def _run(model, loader):
+    preds, labels, times = [], [], []
+    for data in loader:
+        t0 = time.perf_counter()
+        out = model(data.x, data.edge_index, batch=data.batch)
+        times.append(time.perf_counter() - t0)
+        preds.append(out.reshape(-1))
+        labels.append(data.y.reshape(-1))
+    return torch.cat(preds), torch.cat(labels), np.array(times)
+
+def compare(eager, exported, dataset, batch_size=1, repeats=3):
+    """Latency and accuracy of the exported model against the eager one on the given graphs"""
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False)
+    _run(eager, loader), _run(exported, loader)  # warm-up (TorchScript profiles its first calls)
+    eager_t, exported_t = [], []
+    for _ in range(repeats):
+        p_eager, y, t = _run(eager, loader)
+        eager_t.append(t)
+        p_exp, _, t = _run(exported, loader)
+        exported_t.append(t)
+    eager_ms = np.median(np.concatenate(eager_t)) * 1e3
+    exported_ms = np.median(np.concatenate(exported_t)) * 1e3
+    diff = (p_exp - p_eager).abs()
+    return {
+        "graphs": len(dataset),
+        "batch_size": batch_size,
+        "eager_ms_per_batch": round(float(eager_ms), 3),
+        "exported_ms_per_batch": round(float(exported_ms), 3),
+        "speedup": round(float(eager_ms / exported_ms), 2),
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "eager_mse": float(torch.mean((p_eager - y) ** 2)),
+        "exported_mse": float(torch.mean((p_exp - y) ** 2)),
+    }
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Export the trained GNN for serving and compare it with eager mode")
+    ap.add_argument("--weights", default=MODEL_PATH)
+    ap.add_argument("--out", default=EXPORT_PATH)
+    ap.add_argument("--quantize", action="store_true", help="dynamic int8 quantization of the linear layers")
+    ap.add_argument("--batch-sizes", default="1,8", help="batch sizes to benchmark on the archive")
+    ap.add_argument("--no-report", action="store_true", help="skip the comparison on the archived snapshots")
+    ap.add_argument("--report", help="also write the comparison as JSON to this path")
+    return ap.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    eager, exported = export_model(args.weights, args.out, quantize=args.quantize)
+    if not args.no_report:
+        from dataset import ShardedGraphDataset
+        from train import prepare_graph_shards
+        dataset = ShardedGraphDataset(prepare_graph_shards())
+        reports = [compare(eager, exported, dataset, batch_size=int(b)) for b in args.batch_sizes.split(",")]
+        for r in reports:
+            logger.info("batch=%d: eager %.3f ms, exported %.3f ms (x%.2f); max|diff|=%.2e, mse eager=%.6f exported=%.6f",
+                        r["batch_size"], r["eager_ms_per_batch"], r["exported_ms_per_batch"], r["speedup"],
+                        r["max_abs_diff"], r["eager_mse"], r["exported_mse"])
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump({"quantized": args.quantize, "results": reports}, f, indent=2)
@@ -0,0 +1,188 @@
+# backend/gnn_pipeline/feature_cache.py
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from .image_features import extract_features_batch, profile_signature, EMBEDDING_DIM
+
+logger = logging.getLogger("feature_cache")
+
+FEATURE_CACHE_SIZE = int(os.getenv("FEATURE_CACHE_SIZE", "4096"))
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR")  # unset -> memory tier only
+FEATURE_CACHE_FAST_KEYS = os.getenv("FEATURE_CACHE_FAST_KEYS", "1") == "1"
+
+
+def content_key(data):
+    # content address of an encoded image (bytes) or decoded pixels (array/PIL)
+    if isinstance(data, Image.Image):
+        data = np.asarray(data.convert("RGB"))
+    if isinstance(data, np.ndarray):
+        h = hashlib.blake2b(digest_size=20)
+        h.update(str(data.shape).encode())
+        h.update(np.ascontiguousarray(data).tobytes())
+        return h.hexdigest()
+    return hashlib.blake2b(bytes(data), digest_size=20).hexdigest()
+
+
+def fast_key(camera_id, timestamp):
+    # LTA publishes one image per (CameraID, Timestamp), so this skips hashing
+    return f"{camera_id}@{timestamp}"
+
+
+class FeatureCache:
+    """
+    Two-tier cache of (vehicle_count, embedding) in front of the extractor.
+
+    The memory tier is a bounded LRU keyed by content hash, plus optional
+    CameraID@Timestamp aliases. The disk tier (one .npz per content hash under
+    disk_dir/<embedding profile>) survives restarts and is shared between workers.
+    """
+
+    def __init__(self, max_entries=FEATURE_CACHE_SIZE, disk_dir=FEATURE_CACHE_DIR):
+        self.max_entries = max_entries
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self.hits = 0
+        self.fast_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._namespace = None
+
+    def _disk_path(self, key):
+        if self._namespace is None:
+            # resolved on first use: a PCA profile's signature includes its basis file
+            self._namespace = profile_signature().replace("/", "_").replace(":", "-")
+        return self.disk_dir / self._namespace / key[:2] / f"{key}.npz"
+
+    def _remember(self, key, value):
+        # caller holds the lock
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get_fast(self, fast):
+        # alias lookup only; a miss here is not counted (the content lookup follows)
+        with self._lock:
+            if fast in self._lru:
+                self._lru.move_to_end(fast)
+                self.fast_hits += 1
+                return self._lru[fast]
+        return None
+
+    def get(self, key, fast=None):
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                value = self._lru[key]
+                if fast is not None:
+                    self._remember(fast, value)
+                return value
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            if path.exists():
+                try:
+                    with np.load(path) as f:
+                        value = (int(f["vehicle_count"]), f["embedding"].astype(np.float32))
+                    with self._lock:
+                        self.disk_hits += 1
+                        self._remember(key, value)
+                        if fast is not None:
+                            self._remember(fast, value)
+                    return value
+                except Exception as e:
+                    logger.warning("unreadable cache entry %s: %s", path, e)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, vehicle_count, embedding, fast=None):
+        value = (int(vehicle_count), np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            self._remember(key, value)
+            if fast is not None:
+                self._remember(fast, value)
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            if not path.exists():
+                path.parent.mkdir(exist_ok=True)
+                tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                try:
+                    with open(tmp, "wb") as f:
+                        np.savez(f, vehicle_count=value[0], embedding=value[1])
+                    os.replace(tmp, path)
+                except OSError as e:
+                    logger.warning("could not write cache entry %s: %s", path, e)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.fast_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._lru),
+                "max_entries": self.max_entries,
+                "disk_dir": str(self.disk_dir) if self.disk_dir else None,
+                "hits": self.hits,
+                "fast_hits": self.fast_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+            }
+
+
+feature_cache = FeatureCache()
+
+
+def extract_features_cached(images, fast_keys=None, max_batch_size=None, cache=None):
+    """
+    Cached drop-in for extract_features_batch.
+
+    images: JPEG bytes/buffers, paths, PIL images or RGB arrays.
+    fast_keys: optional per-image fast_key(CameraID, Timestamp) aliases.
+    Only cache misses are sent through the batched extractor.
+    """
+    cache = cache or feature_cache
+    n = len(images)
+    fasts = list(fast_keys) if (fast_keys is not None and FEATURE_CACHE_FAST_KEYS) else [None] * n
+    counts = np.zeros(n, dtype=np.int64)
+    embeddings = np.zeros((n, EMBEDDING_DIM), dtype=np.float32)
+    misses = []  # (index, content key, encoded image)
+    for i, img in enumerate(images):
+        hit = cache.get_fast(fasts[i]) if fasts[i] is not None else None
+        if hit is None:
+            if isinstance(img, (str, os.PathLike)):
+                with open(img, "rb") as f:
+                    img = f.read()
+            elif hasattr(img, "read"):
+                img = img.read()
+            key = content_key(img)
+            hit = cache.get(key, fast=fasts[i])
+            if hit is None:
+                misses.append((i, key, img))
+                continue
+        counts[i], embeddings[i] = hit
+
+    if misses:
+        # identical images (e.g. the same camera in coalesced requests) are extracted once
+        unique = {}
+        for _, key, img in misses:
+            unique.setdefault(key, img)
+        keys = list(unique)
+        miss_counts, miss_embs = extract_features_batch(list(unique.values()), max_batch_size=max_batch_size)
+        extracted = dict(zip(keys, zip(miss_counts, miss_embs)))
+        for i, key, _ in misses:
+            vc, emb = extracted[key]
+            counts[i], embeddings[i] = vc, emb
+            cache.put(key, vc, emb, fast=fasts[i])
+    return counts, embeddings
@@ -0,0 +1,54 @@
+# backend/gnn_pipeline/fit_pca.py
+import os
+import argparse
+import numpy as np
+from sklearn.decomposition import PCA
+from snapshot_store import SnapshotStore, SNAPSHOT_STORE_DIR
+from image_features import BACKBONE_DIM, PCA_PATH, PROFILE, EMBEDDING_PROFILE, extract_features_batch, pca_path, profile_signature
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("fit_pca")
+
+DATA_DIR = os.getenv("DOWNLOAD_DIR", "./data/images")
+
+def raw_archive_embeddings(store, max_images=5000, seed=0):
+    """
+    Raw 1280-d backbone embeddings for (a sample of) the distinct archived images.
+    Reuses the store's matrix when it already holds raw embeddings of this
+    backbone; otherwise runs the backbone over the sampled images.
+    """
+    store.ingest_directory(DATA_DIR)
+    snaps = store.query()
+    _, first = np.unique(snaps["content_hash"].astype(str), return_index=True)
+    rng = np.random.default_rng(seed)
+    pick = rng.permutation(first)[:max_images]
+    backbone = profile_signature(pca=False)
+    if store.embedding_profile == backbone and store.embedding_dim == BACKBONE_DIM:
+        have = pick[snaps["embedding_offset"][pick] >= 0]
+        if len(have) == len(pick):
+            logger.info("Using %d stored %s embeddings", len(have), backbone)
+            return store.embeddings(snaps["embedding_offset"][have])
+    logger.info("Extracting %d raw %s embeddings", len(pick), backbone)
+    return extract_features_batch(list(snaps["path"][pick]), project=False)[1]
+
+def fit_pca(embeddings, dim, out_path=PCA_PATH):
+    pca = PCA(n_components=dim, svd_solver="full").fit(embeddings)
+    tmp = f"{out_path}.part.npz"
+    np.savez(tmp, mean=pca.mean_.astype(np.float32), components=pca.components_.astype(np.float32),
+             explained_variance_ratio=pca.explained_variance_ratio_, backbone=np.array(profile_signature(pca=False)))
+    os.replace(tmp, out_path)
+    logger.info("PCA %d -> %d keeps %.1f%% of the variance; saved to %s",
+                embeddings.shape[1], dim, 100 * pca.explained_variance_ratio_.sum(), out_path)
+    return pca
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Fit the PCA basis of the active EMBEDDING_PROFILE on the archive")
+    ap.add_argument("--dim", type=int, default=PROFILE["pca_dim"], help="output embedding size")
+    ap.add_argument("--max-images", type=int, default=5000)
+    ap.add_argument("--out", help="output .npz (default: where a server with EMBEDDING_PCA_DIM=--dim looks for it)")
+    ap.add_argument("--store", default=SNAPSHOT_STORE_DIR, help="snapshot store to sample (its raw embeddings are reused when compatible)")
+    args = ap.parse_args()
+    if not args.dim:
+        raise SystemExit(f"profile {EMBEDDING_PROFILE!r} has no pca_dim; pass --dim or set EMBEDDING_PCA_DIM")
+    fit_pca(raw_archive_embeddings(SnapshotStore(args.store), args.max_images), args.dim, args.out or pca_path(args.dim))
@@ -1,53 +1,128 @@
 # backend/gnn_pipeline/graph_builder.py
 import math
+import threading
+from collections import OrderedDict
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
+from sklearn.neighbors import BallTree
 from typing import List, Dict, Any
+from dateutil import parser
 import torch
 
+EMBEDDING_DIM = 1280
+TOPOLOGY_CACHE_SIZE = 64
+EARTH_RADIUS_M = 6371000
+
+# (sorted camera ids, coords, k, radius_m) -> (edge_index, edge distances) over the sorted camera order
+_topology_cache = OrderedDict()
+_topology_lock = threading.Lock()
+
 def haversine(lat1, lon1, lat2, lon2):
     # returns meters
-    R = 6371000
+    R = EARTH_RADIUS_M
     phi1, phi2 = math.radians(lat1), math.radians(lat2)
     dphi = math.radians(lat2 - lat1)
     dlambda = math.radians(lon2 - lon1)
     a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
     return 2*R*math.asin(math.sqrt(a))
 
-def build_graph(cameras: List[Dict[str,Any]], k=4):
-    # cameras: list of dict each with keys 'camera_id','lat','lon','vehicle_count','embedding'(ndarray), 'timestamp'
-    coords = np.array([[c["Latitude"], c["Longitude"]] for c in cameras])
-    # use nearest neighbors by haversine -> convert degrees to radians approx; here using Euclidean on lat/lon is fine for small areas
-    nbrs = NearestNeighbors(n_neighbors=min(k+1, len(cameras))).fit(coords)
-    distances, indices = nbrs.kneighbors(coords)
-    edge_index = []
-    for i, inds in enumerate(indices):
-        for j in inds[1:]:  # skip self
-            edge_index.append([i, j])
-    # Build node features
-    node_features = []
-    for c in cameras:
-        vc = float(c.get("vehicle_count", 0))
-        ts = c.get("Timestamp")
-        # hour features
+def _neighbour_edges(coords, k=4, radius_m=None):
+    # great-circle neighbour search on a haversine BallTree: O(N log N) build + queries
+    n = len(coords)
+    rad = np.radians(coords)
+    tree = BallTree(rad, metric="haversine")
+    rows = np.arange(n)
+    if radius_m is not None:
+        ind, dist = tree.query_radius(rad, r=radius_m / EARTH_RADIUS_M, return_distance=True)
+        counts = np.array([len(i) for i in ind])
+        src = np.repeat(rows, counts)
+        dst = np.concatenate(ind).astype(np.int64) if n else np.empty(0, dtype=np.int64)
+        d = np.concatenate(dist) if n else np.empty(0)
+        keep = src != dst
+        src, dst, d = src[keep], dst[keep], d[keep]
+    else:
+        dist, ind = tree.query(rad, k=min(k+1, n))
+        # drop self; with duplicate coordinates self may be missing from the
+        # result, in which case the farthest hit is dropped instead
+        self_mask = ind == rows[:, None]
+        self_mask[~self_mask.any(axis=1), -1] = True
+        keep = ~self_mask
+        m = keep.sum(axis=1)[0] if n else 0
+        src = np.repeat(rows, m)
+        dst = ind[keep]
+        d = dist[keep]
+    edge_index = np.stack([src, dst]).astype(np.int64)
+    return edge_index, (d * EARTH_RADIUS_M).astype(np.float32)
+
+def neighbour_topology(camera_ids, coords, k=4, radius_m=None):
+    """
+    Neighbour graph for a camera set: k-NN, or every pair within radius_m
+    metres when radius_m is given. Returns (edge_index [2,E], distances_m [E]).
+
+    Cached on (sorted CameraIDs, coords, k, radius_m). Camera locations are
+    fixed, so the search runs once per camera set; cached edges are stored in
+    sorted-id order and remapped to the caller's node order on every hit.
+    """
+    ids = np.asarray([str(c) for c in camera_ids])
+    order = np.argsort(ids, kind="stable")
+    sorted_coords = np.ascontiguousarray(coords[order], dtype=np.float64)
+    key = (tuple(ids[order]), sorted_coords.tobytes(), int(k), radius_m)
+    with _topology_lock:
+        cached = _topology_cache.get(key)
+        if cached is not None:
+            _topology_cache.move_to_end(key)
+    if cached is None:
+        cached = _neighbour_edges(sorted_coords, k=k, radius_m=radius_m)
+        with _topology_lock:
+            _topology_cache[key] = cached
+            while len(_topology_cache) > TOPOLOGY_CACHE_SIZE:
+                _topology_cache.popitem(last=False)
+    edges, dist = cached
+    return order[edges], dist
+
+def _hour_encoding(timestamps):
+    # parse each distinct timestamp once per snapshot (usually a handful)
+    hours = {}
+    for ts in set(timestamps):
         try:
-            from dateutil import parser
-            dt = parser.parse(ts)
-            h = dt.hour
+            hours[ts] = parser.parse(ts).hour
         except Exception:
-            h = 0
-        hour_sin = math.sin(2*math.pi*h/24)
-        hour_cos = math.cos(2*math.pi*h/24)
-        lat = float(c["Latitude"])
-        lon = float(c["Longitude"])
-        embedding = c.get("embedding")
-        if embedding is None:
-            embedding = np.zeros(1280, dtype=np.float32)
-        # numeric features vector
-        base = np.array([vc, hour_sin, hour_cos, lat, lon], dtype=np.float32)
-        feat = np.concatenate([base, embedding.astype(np.float32)])
-        node_features.append(feat)
-    x = torch.tensor(np.vstack(node_features), dtype=torch.float)
-    # edges to edge_index tensor
-    edge_index = torch.tensor(np.array(edge_index).T, dtype=torch.long) if edge_index else torch.empty((2,0), dtype=torch.long)
-    return x, edge_index
+            hours[ts] = 0
+    h = np.array([hours[ts] for ts in timestamps], dtype=np.float32)
+    return np.sin(2*np.pi*h/24), np.cos(2*np.pi*h/24)
+
+def node_features(vehicle_counts, timestamps, coords, embeddings, dim=EMBEDDING_DIM):
+    # node feature matrix, column-wise: [vehicle_count, hour_sin, hour_cos, lat, lon, embedding...]
+    # embeddings: [N, dim] array, or a list that may contain None (left as zeros)
+    n = len(timestamps)
+    x = np.zeros((n, 5 + dim), dtype=np.float32)
+    x[:, 0] = vehicle_counts
+    x[:, 1], x[:, 2] = _hour_encoding(timestamps)
+    x[:, 3:5] = coords
+    if isinstance(embeddings, np.ndarray):
+        x[:, 5:] = embeddings
+    elif all(e is not None for e in embeddings):
+        x[:, 5:] = np.stack(embeddings) if n else 0
+    else:
+        for i, e in enumerate(embeddings):
+            if e is not None:
+                x[i, 5:] = e
+    return x
+
+def build_graph(cameras: List[Dict[str,Any]], k=4, radius_m=None, return_edge_attr=False):
+    # cameras: list of dict each with keys 'CameraID','Latitude','Longitude','vehicle_count','embedding'(ndarray), 'Timestamp'
+    # k-NN graph by default; radius_m switches to a radius graph. With return_edge_attr
+    # the great-circle edge length in metres is returned as edge_attr [E,1].
+    coords = np.array([[c["Latitude"], c["Longitude"]] for c in cameras], dtype=np.float64)
+    camera_ids = [c.get("CameraID", i) for i, c in enumerate(cameras)]
+    edge_index, dist = neighbour_topology(camera_ids, coords, k=k, radius_m=radius_m)
+
+    embeddings = [c.get("embedding") for c in cameras]
+    dim = next((len(e) for e in embeddings if e is not None), EMBEDDING_DIM)
+    x = node_features(
+        [float(c.get("vehicle_count", 0)) for c in cameras],
+        [c.get("Timestamp") for c in cameras],
+        coords, embeddings, dim=dim
+    )
+    if return_edge_attr:
+        return torch.from_numpy(x), torch.from_numpy(edge_index), torch.from_numpy(dist).unsqueeze(1)
+    return torch.from_numpy(x), torch.from_numpy(edge_index)
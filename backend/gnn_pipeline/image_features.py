@@ -1,84 +1,336 @@
 # backend/gnn_pipeline/image_features.py
+import hashlib
+import importlib.util
+import io
 import os
+import threading
+from pathlib import Path
 from PIL import Image
 import numpy as np
 import torch
-from torchvision import transforms, models
+from torchvision import models
 import logging
 
 logger = logging.getLogger("image_features")
-try:
-    from ultralytics import YOLO
-    YOLO_AVAILABLE = True
-except Exception:
-    YOLO_AVAILABLE = False
-
-# Preprocess
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485,0.456,0.406], std=[0.229,0.224,0.225])
-])
-
-# Feature extractor: MobileNet backbone returning embedding
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-_mobilenet = models.mobilenet_v2(pretrained=True).to(device)
-_mobilenet.eval()
-
-# Regression head optional (simple linear) for vehicle count estimate
-_reg_head = torch.nn.Sequential(
-    torch.nn.AdaptiveAvgPool2d(1),
-    torch.nn.Flatten(),
-    torch.nn.Linear(1280, 256),
-    torch.nn.ReLU(),
-    torch.nn.Linear(256, 1)
-).to(device)
-# NOTE: reg head needs training if you use fallback; we will use heuristics initially.
-
-if YOLO_AVAILABLE:
-    logger.info("YOLO available, loading tiny model")
-    # use yolov8n or yolov8s (lean)
-    yolo = YOLO("yolov8n.pt")  # local model will be auto-downloaded if needed
-
-def extract_with_yolo(image_path):
-    # returns vehicle_count, embedding (avg pooled from mobilenet)
+# ultralytics is heavy to import; only check it is installed here, import it in get_yolo()
+YOLO_AVAILABLE = importlib.util.find_spec("ultralytics") is not None
+
+# Embedding profiles: trade a little embedding fidelity for per-image CPU cost and a
+# smaller node-feature matrix. The GNN input width follows the profile (5 + EMBEDDING_DIM),
+# so weights trained under one profile only load under the same one.
+#   resolution     input side fed to MobileNetV2 (224 = ImageNet default)
+#   quantized      static int8 MobileNetV2 from torchvision.models.quantization (CPU only)
+#   channels_last  NHWC layout for the fp32 backbone
+#   pca_dim        project the 1280-d pooled features onto a PCA basis fitted on the archive (fit_pca.py)
+EMBEDDING_PROFILES = {
+    "full":    {"resolution": 224, "quantized": False, "channels_last": False, "pca_dim": None},
+    "fast":    {"resolution": 224, "quantized": False, "channels_last": True,  "pca_dim": None},
+    "int8":    {"resolution": 224, "quantized": True,  "channels_last": False, "pca_dim": None},
+    "lite":    {"resolution": 160, "quantized": True,  "channels_last": False, "pca_dim": None},
+    "compact": {"resolution": 160, "quantized": True,  "channels_last": False, "pca_dim": 128},
+}
+
+def _profile_settings(name):
+    if name not in EMBEDDING_PROFILES:
+        raise ValueError(f"unknown EMBEDDING_PROFILE {name!r}; choose from {sorted(EMBEDDING_PROFILES)}")
+    settings = dict(EMBEDDING_PROFILES[name])
+    # individual knobs can be overridden on top of the named profile
+    if os.getenv("EMBEDDING_RESOLUTION"):
+        settings["resolution"] = int(os.getenv("EMBEDDING_RESOLUTION"))
+    if os.getenv("EMBEDDING_QUANTIZED"):
+        settings["quantized"] = os.getenv("EMBEDDING_QUANTIZED") == "1"
+    if os.getenv("EMBEDDING_CHANNELS_LAST"):
+        settings["channels_last"] = os.getenv("EMBEDDING_CHANNELS_LAST") == "1"
+    if os.getenv("EMBEDDING_PCA_DIM"):
+        settings["pca_dim"] = int(os.getenv("EMBEDDING_PCA_DIM")) or None
+    return settings
+
+EMBEDDING_PROFILE = os.getenv("EMBEDDING_PROFILE", "full")
+PROFILE = _profile_settings(EMBEDDING_PROFILE)
+BACKBONE_DIM = 1280  # MobileNetV2 pooled features
+def pca_path(dim):
+    # where fit_pca.py writes (and serving reads) the PCA basis for a given output size
+    return os.getenv("EMBEDDING_PCA_PATH") or str(Path(__file__).resolve().parent.parent / f"embedding_pca_{dim}.npz")
+
+PCA_PATH = pca_path(PROFILE["pca_dim"])
+# torchvision only ships int8 MobileNetV2 weights calibrated for QNNPACK (which also runs on
+# x86); the quantized engine has to match the weights or the builder refuses to load them
+QUANT_ENGINE = "qnnpack"
+
+# Preprocess: resize to resolution x resolution, scale to [0,1], ImageNet normalization
+IMAGENET_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+IMAGENET_STD = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+
+device = torch.device("cuda" if torch.cuda.is_available() and not PROFILE["quantized"] else "cpu")
+
+# Heavy models are built lazily on first use (or by warmup()), never at import time.
+# Per-model state: not_loaded -> loading -> ready | failed ("unavailable" if not installed)
+_mobilenet = None
+_pca = None
+_yolo = None
+_mobilenet_lock = threading.Lock()
+_yolo_lock = threading.Lock()
+_model_state = {
+    "mobilenet": "not_loaded",
+    "yolo": "not_loaded" if YOLO_AVAILABLE else "unavailable",
+}
+
+def _build_mobilenet(settings):
+    if settings["quantized"]:
+        from torchvision.models import quantization
+        if QUANT_ENGINE not in torch.backends.quantized.supported_engines:
+            raise RuntimeError(f"quantized profiles need the {QUANT_ENGINE} engine, this torch build has "
+                               f"{torch.backends.quantized.supported_engines}")
+        torch.backends.quantized.engine = QUANT_ENGINE
+        # backend comes from the pretrained weights' metadata (qnnpack)
+        model = quantization.mobilenet_v2(pretrained=True, quantize=True)
+    else:
+        model = models.mobilenet_v2(pretrained=True).to(device)
+        if settings["channels_last"]:
+            model = model.to(memory_format=torch.channels_last)
+    return model.eval()
+
+def get_mobilenet():
+    # Feature extractor: MobileNet backbone returning embedding
+    global _mobilenet
+    if _mobilenet is None:
+        with _mobilenet_lock:
+            if _mobilenet is None:
+                _model_state["mobilenet"] = "loading"
+                try:
+                    model = _build_mobilenet(PROFILE)
+                except Exception:
+                    _model_state["mobilenet"] = "failed"
+                    raise
+                _mobilenet = model
+                _model_state["mobilenet"] = "ready"
+    return _mobilenet
+
+def profile_signature(pca=True):
+    # identifies the embedding space: stores/caches keyed on it never mix profiles
+    sig = f"mobilenet_v2/{PROFILE['resolution']}/{'int8' if PROFILE['quantized'] else 'fp32'}"
+    if pca and PROFILE["pca_dim"]:
+        with open(PCA_PATH, "rb") as f:
+            sig += f"/pca{PROFILE['pca_dim']}:{hashlib.sha256(f.read()).hexdigest()[:12]}"
+    return sig
+
+def _load_pca():
+    global _pca
+    if _pca is None:
+        if not os.path.exists(PCA_PATH):
+            raise FileNotFoundError(f"profile {EMBEDDING_PROFILE!r} needs a PCA basis at {PCA_PATH}; run fit_pca.py")
+        with np.load(PCA_PATH, allow_pickle=False) as f:
+            if str(f["backbone"]) != profile_signature(pca=False) or f["components"].shape[0] != PROFILE["pca_dim"]:
+                raise ValueError(f"{PCA_PATH} was fitted for {f['backbone']} / {f['components'].shape[0]} dims, "
+                                 f"profile is {profile_signature(pca=False)} / {PROFILE['pca_dim']}")
+            _pca = (f["mean"].astype(np.float32), f["components"].T.astype(np.float32).copy())
+    return _pca
+
+def embedding_profile():
+    return {"name": EMBEDDING_PROFILE, "embedding_dim": EMBEDDING_DIM, **PROFILE,
+            "quant_engine": QUANT_ENGINE if PROFILE["quantized"] else None}
+
+def get_yolo():
+    # returns the YOLO detector, or None if ultralytics is missing or the load failed
+    global _yolo
+    if _yolo is None and YOLO_AVAILABLE and _model_state["yolo"] != "failed":
+        with _yolo_lock:
+            if _yolo is None and _model_state["yolo"] != "failed":
+                _model_state["yolo"] = "loading"
+                try:
+                    from ultralytics import YOLO
+                    logger.info("YOLO available, loading tiny model")
+                    # use yolov8n or yolov8s (lean)
+                    _yolo = YOLO("yolov8n.pt")  # local model will be auto-downloaded if needed
+                    _model_state["yolo"] = "ready"
+                except Exception as e:
+                    logger.exception("YOLO load failed, using fallback counter: %s", e)
+                    _model_state["yolo"] = "failed"
+    return _yolo
+
+def model_status():
+    return dict(_model_state)
+
+# Vehicle-like COCO classes: car(2), motorcycle(3), bus(5), truck(7)
+VEHICLE_CLASSES = [2, 3, 5, 7]
+EMBEDDING_DIM = PROFILE["pca_dim"] or BACKBONE_DIM
+MAX_BATCH_SIZE = int(os.getenv("FEATURE_MAX_BATCH_SIZE", "32"))
+# detector throughput knobs (see bench_detector.py for the count/latency trade-off)
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))
+YOLO_CONF = float(os.getenv("YOLO_CONF", "0.25"))
+YOLO_MAX_DET = int(os.getenv("YOLO_MAX_DET", "200"))
+# let libjpeg decode straight at 1/2, 1/4 or 1/8 scale when the frame is only needed smaller
+JPEG_DRAFT = os.getenv("FEATURE_JPEG_DRAFT", "1") == "1"
+FALLBACK_SIZE = 224  # frame side for the heuristic counter when YOLO is not available
+
+def _load_image(image, target=None):
+    # accepts a file path, raw JPEG bytes, a binary buffer, an already-decoded
+    # PIL image or an HxWx3 uint8 RGB array; in-memory inputs never touch disk.
+    # target: the size the frame will be shrunk to afterwards, either a long side
+    # (aspect kept) or a (w, h) box; JPEGs are then draft-decoded to no less than that
+    if isinstance(image, Image.Image):
+        return image.convert("RGB")
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image).convert("RGB")
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = io.BytesIO(image)
+    img = Image.open(image)
+    if JPEG_DRAFT and target and img.format == "JPEG":
+        if isinstance(target, int):
+            w, h = img.size
+            scale = target / max(w, h)
+            target = (int(np.ceil(w * scale)), int(np.ceil(h * scale)))
+        img.draft("RGB", target)
+    return img.convert("RGB")
+
+def _pixels(imgs):
+    # resize every frame to the backbone resolution into one [N,res,res,3] uint8 buffer
+    res = PROFILE["resolution"]
+    buf = np.empty((len(imgs), res, res, 3), dtype=np.uint8)
+    for i, img in enumerate(imgs):
+        if img.size != (res, res):
+            img = img.resize((res, res), Image.BILINEAR)
+        buf[i] = np.asarray(img)
+    return buf
+
+def _input_tensor(pixels):
+    # [N,H,W,3] uint8 -> normalized [N,3,H,W] float in a single allocation, laid out for the profile
+    n, h, w, _ = pixels.shape
+    fmt = torch.channels_last if PROFILE["channels_last"] else torch.contiguous_format
+    x = torch.empty((n, 3, h, w), dtype=torch.float32, memory_format=fmt)
+    x.copy_(torch.from_numpy(pixels).permute(0, 3, 1, 2))
+    return x.div_(255).sub_(IMAGENET_MEAN).div_(IMAGENET_STD)
+
+def _embed_batch(imgs, project=True):
+    # one MobileNetV2 features pass over the whole chunk -> [N,EMBEDDING_DIM]
+    # (project=False returns the raw [N,1280] pooled features, used to fit the PCA basis)
+    return _embed_pixels(_pixels(imgs), project=project)
+
+def _embed_pixels(pixels, project=True):
+    x = _input_tensor(pixels).to(device)
+    model = get_mobilenet()
+    with torch.no_grad():
+        if PROFILE["quantized"]:
+            features = model.dequant(model.features(model.quant(x)))
+        else:
+            features = model.features(x)
+        pooled = torch.nn.functional.adaptive_avg_pool2d(features, 1).flatten(1)
+    emb = pooled.cpu().numpy().astype(np.float32)
+    if project and PROFILE["pca_dim"]:
+        mean, basis = _load_pca()
+        emb = (emb - mean) @ basis
+    return emb
+
+def _shrink(img, side):
+    # one shared downscale per frame: YOLO letterboxes to imgsz anyway and the
+    # MobileNet transform then resizes from a 640px frame instead of a 1080p one
+    w, h = img.size
+    scale = side / max(w, h)
+    if scale >= 1:
+        return img
+    return img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BILINEAR)
+
+def _count_with_yolo(imgs, imgsz=None):
+    # vehicle classes are filtered inside the detector's NMS rather than after it, and a
+    # list of in-memory frames goes through the network as a single batch
+    imgsz = imgsz or YOLO_IMGSZ
     try:
-        res = yolo.predict(source=image_path, imgsz=640, conf=0.25, classes=None, max_det=200)
-        # classes for vehicle-like: car(2), motorcycle(3), bus(5), truck(7) depending on COCO indexing
-        preds = res[0]
-        boxes = preds.boxes
-        # filter by class indices: 2 car, 3 motorbike, 5 bus, 7 truck (COCO) - but confirm YOLO variant
-        cls = boxes.cls.cpu().numpy().astype(int) if hasattr(boxes, "cls") else np.array([])
-        vehicle_mask = np.isin(cls, [2,3,5,7])
-        vehicle_count = int(vehicle_mask.sum())
+        results = get_yolo().predict(source=list(imgs), imgsz=imgsz, conf=YOLO_CONF,
+                                     classes=VEHICLE_CLASSES, max_det=YOLO_MAX_DET, verbose=False)
+        return np.array([len(preds.boxes) for preds in results], dtype=np.int64)
     except Exception as e:
         logger.exception("YOLO failed: %s", e)
-        vehicle_count = 0
-    # embedding:
-    img = Image.open(image_path).convert("RGB")
-    x = transform(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        features = _mobilenet.features(x)
-        pooled = torch.nn.functional.adaptive_avg_pool2d(features, 1).flatten(1).cpu().numpy()[0]
-    return vehicle_count, pooled
-
-def fallback_extract(image_path):
-    # simple feature + heuristic vehicle count: count bright blobs on road area - quick heuristic
-    img = Image.open(image_path).convert("RGB").resize((224,224))
-    arr = np.array(img).astype(np.float32) / 255.0
-    gray = arr.mean(axis=2)
-    # threshold bright spots (cars headlights) - not robust but fallback
-    bright = (gray > 0.7).astype(np.uint8)
-    vehicle_count = int(np.clip(bright.sum() / 30, 0, 200))
-    # embedding via mobilenet backbone
-    x = transform(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        features = _mobilenet.features(x)
-        pooled = torch.nn.functional.adaptive_avg_pool2d(features, 1).flatten(1).cpu().numpy()[0]
-    return vehicle_count, pooled
+        return np.zeros(len(imgs), dtype=np.int64)
+
+def _count_fallback(imgs):
+    # simple heuristic vehicle count: count bright blobs (headlights) - not robust but fallback
+    # imgs: FALLBACK_SIZE frames, or their [N,H,W,3] uint8 pixels
+    arr = imgs if isinstance(imgs, np.ndarray) else np.stack([np.asarray(img) for img in imgs])
+    bright = (arr.mean(axis=3, dtype=np.float32) > 0.7 * 255).sum(axis=(1, 2))
+    return np.clip(bright / 30, 0, 200).astype(np.int64)
+
+def _decode_frames(images, yolo):
+    # decode each input exactly once, at (or draft-decoded near) the size both models share
+    if yolo:
+        return [_shrink(_load_image(img, YOLO_IMGSZ), YOLO_IMGSZ) for img in images]
+    box = (FALLBACK_SIZE, FALLBACK_SIZE)
+    return [_load_image(img, box).resize(box) for img in images]
+
+def _process_frames(frames, yolo, project=True):
+    # counting and embedding for one chunk of decoded frames in a single step;
+    # the backbone's uint8 pixel buffer doubles as the fallback counter's input
+    pixels = _pixels(frames)
+    if yolo:
+        counts = _count_with_yolo(frames)
+    else:
+        counts = _count_fallback(pixels if pixels.shape[1] == FALLBACK_SIZE else frames)
+    return counts, _embed_pixels(pixels, project=project)
+
+def extract_features_batch(images, max_batch_size=None, project=True):
+    """
+    Batched feature extraction for a snapshot of camera images.
+
+    images: sequence of image paths, JPEG bytes/buffers, PIL images or RGB arrays.
+    Returns (counts [N] int64, embeddings [N,EMBEDDING_DIM] float32). Images are
+    processed in chunks of at most max_batch_size (FEATURE_MAX_BATCH_SIZE).
+    project=False skips the profile's PCA projection (raw 1280-d features).
+    """
+    n = len(images)
+    counts = np.zeros(n, dtype=np.int64)
+    dim = EMBEDDING_DIM if project else BACKBONE_DIM
+    embeddings = np.zeros((n, dim), dtype=np.float32)
+    step = max(1, int(max_batch_size or MAX_BATCH_SIZE))
+    yolo = get_yolo() is not None
+    for start in range(0, n, step):
+        frames = _decode_frames(images[start:start + step], yolo)
+        end = start + len(frames)
+        counts[start:end], embeddings[start:end] = _process_frames(frames, yolo, project=project)
+    return counts, embeddings
+
+def extract_with_yolo(image):
+    # returns vehicle_count, embedding (avg pooled from mobilenet)
+    counts, embeddings = _process_frames(_decode_frames([image], True), True)
+    return int(counts[0]), embeddings[0]
+
+def fallback_extract(image):
+    counts, embeddings = _process_frames(_decode_frames([image], False), False)
+    return int(counts[0]), embeddings[0]
+
+def warmup():
+    # build the models and run one dummy forward so the first request pays nothing
+    _embed_batch([Image.new("RGB", (PROFILE["resolution"], PROFILE["resolution"]))])
+    yolo = get_yolo()
+    if yolo is not None:
+        _count_with_yolo([Image.new("RGB", (YOLO_IMGSZ, YOLO_IMGSZ))])
+
+def check_profiles():
+    """
+    Smoke check: build the backbone of every EMBEDDING_PROFILES entry and run one
+    dummy image through it. Returns {profile: None | error message}.
+    """
+    from torchvision.models.quantization import MobileNet_V2_QuantizedWeights
+    results = {}
+    for name, settings in EMBEDDING_PROFILES.items():
+        try:
+            if settings["quantized"] and MobileNet_V2_QuantizedWeights.DEFAULT.meta["backend"] != QUANT_ENGINE:
+                raise RuntimeError(f"pretrained int8 weights are for {MobileNet_V2_QuantizedWeights.DEFAULT.meta['backend']}, "
+                                   f"QUANT_ENGINE is {QUANT_ENGINE}")
+            model = _build_mobilenet(settings)
+            res = settings["resolution"]
+            x = torch.zeros(1, 3, res, res, device="cpu" if settings["quantized"] else device)
+            with torch.no_grad():
+                features = model.dequant(model.features(model.quant(x))) if settings["quantized"] else model.features(x)
+            dim = torch.nn.functional.adaptive_avg_pool2d(features, 1).flatten(1).shape[1]
+            if dim != BACKBONE_DIM:
+                raise RuntimeError(f"backbone returned {dim} features, expected {BACKBONE_DIM}")
+            results[name] = None
+        except Exception as e:
+            results[name] = f"{type(e).__name__}: {e}"
+    return results
 
-def extract_features(image_path):
-    if YOLO_AVAILABLE:
-        return extract_with_yolo(image_path)
+def extract_features(image):
+    # image: path, JPEG bytes/buffer, PIL image or RGB array
+    if get_yolo() is not None:
+        return extract_with_yolo(image)
     else:
-        return fallback_extract(image_path)
+        return fallback_extract(image)
@@ -1,30 +1,117 @@
 # backend/gnn_pipeline/inference.py
 import os
+import logging
 import torch
 from .model import GraphSageNet
-from .image_features import extract_features
+from . import image_features
+from .image_features import extract_features, EMBEDDING_DIM
 from .graph_builder import build_graph
+from .model_registry import registry
 import joblib
 import pathlib
 
 ROOT = pathlib.Path(__file__).resolve().parent.parent  # this gets backend/
 MODEL_PATH = os.getenv("GNN_MODEL_PATH", str(ROOT / "gnn_model.pt"))
+# TorchScript artifact written by export.py; served in preference to the eager model when it matches
+EXPORT_PATH = os.getenv("GNN_EXPORT_PATH", str(ROOT / "gnn_model.ts"))
+USE_EXPORTED = os.getenv("GNN_USE_EXPORTED", "1") == "1"
+HIDDEN_CHANNELS = 128
+GNN_IN_CHANNELS = 5 + EMBEDDING_DIM  # node features assembled by graph_builder
+
+logger = logging.getLogger("inference")
+
+# warm-up progress of the serving GNN (readiness itself comes from the registry)
+_gnn_state = "not_loaded"
 
 
 def load_model(in_channels):
-    model = GraphSageNet(in_channels, hidden_channels=128)
+    # uncached: builds a fresh model from disk (use get_model when serving)
+    model = GraphSageNet(in_channels, hidden_channels=HIDDEN_CHANNELS)
     model.load_state_dict(torch.load(MODEL_PATH, map_location="cpu"))
     model.eval()
     return model
 
+def get_model(in_channels):
+    # resident model from the process-wide registry; reloads only if gnn_model.pt changes.
+    # The exported artifact is used when it was built from the current weights; otherwise
+    # (missing, stale, unloadable) serving falls back to the eager model.
+    if USE_EXPORTED and os.path.exists(EXPORT_PATH):
+        try:
+            model = registry.get_exported(EXPORT_PATH, MODEL_PATH, in_channels)
+            if model is not None:
+                return model
+        except Exception as e:
+            logger.warning("Exported GNN %s unusable, serving eager model: %s", EXPORT_PATH, e)
+    return registry.get(MODEL_PATH, in_channels, hidden_channels=HIDDEN_CHANNELS)
+
 def predict_for_snapshot(camera_dicts):
     # camera_dicts: list of camera dicts (same structure used in graph_builder)
     x, edge_index = build_graph(camera_dicts, k=4)
     in_ch = x.shape[1]
-    model = load_model(in_ch)
+    model = get_model(in_ch)
     with torch.no_grad():
         out = model(x, edge_index)
     # out is graph-level scalar or vector: if multiple graphs? here single graph -> scalar
     if hasattr(out, "item"):
         return float(out.item())
     return float(out[0])
+
+def predict_snapshots(snapshots):
+    # Several independent snapshots (each a list of camera dicts) in one forward:
+    # graphs are built separately and concatenated into a PyG mini-batch with
+    # offset edge_index and a batch vector. Returns one congestion per snapshot.
+    xs, edges, batch = [], [], []
+    offset = 0
+    for i, camera_dicts in enumerate(snapshots):
+        x, edge_index = build_graph(camera_dicts, k=4)
+        xs.append(x)
+        edges.append(edge_index + offset)
+        batch.append(torch.full((x.shape[0],), i, dtype=torch.long))
+        offset += x.shape[0]
+    model = get_model(xs[0].shape[1])
+    with torch.no_grad():
+        out = model(torch.cat(xs), torch.cat(edges, dim=1), batch=torch.cat(batch))
+    return [float(v) for v in out.reshape(-1)]
+
+def predict_scenarios(camera_dicts, vehicle_scales):
+    # Evaluate several "what-if" scenarios that differ only in vehicle_count
+    # (scaled per scenario) as one PyG mini-batch: the snapshot graph is built
+    # once, replicated S times with offset edge_index and a batch vector, and
+    # pushed through the GNN in a single forward pass. Returns S congestions.
+    x, edge_index = build_graph(camera_dicts, k=4)
+    n, s = x.shape[0], len(vehicle_scales)
+    scales = torch.tensor(vehicle_scales, dtype=torch.float)
+    xb = x.repeat(s, 1)
+    xb[:, 0] *= scales.repeat_interleave(n)
+    offsets = (torch.arange(s) * n).repeat_interleave(edge_index.shape[1])
+    eb = edge_index.repeat(1, s) + offsets
+    batch = torch.arange(s).repeat_interleave(n)
+    model = get_model(x.shape[1])
+    with torch.no_grad():
+        out = model(xb, eb, batch=batch)
+    return [float(v) for v in out.reshape(-1)]
+
+def warmup():
+    # load every serving model and run a dummy forward; safe to call from a background thread
+    global _gnn_state
+    image_features.warmup()
+    _gnn_state = "loading"
+    try:
+        model = get_model(GNN_IN_CHANNELS)
+        with torch.no_grad():
+            model(torch.zeros(2, GNN_IN_CHANNELS), torch.tensor([[0, 1], [1, 0]]))
+        _gnn_state = "ready"
+    except Exception:
+        _gnn_state = "failed"
+        raise
+
+def model_status():
+    # per-model readiness: not_loaded | loading | ready | failed | unavailable | missing
+    status = image_features.model_status()
+    if registry.is_loaded(MODEL_PATH, GNN_IN_CHANNELS, HIDDEN_CHANNELS) or registry.is_loaded(EXPORT_PATH, exported=True):
+        status["gnn"] = "ready"
+    elif not os.path.exists(MODEL_PATH):
+        status["gnn"] = "missing"
+    else:
+        status["gnn"] = _gnn_state
+    return status
@@ -0,0 +1,80 @@
+# backend/gnn_pipeline/materialize.py
+import os
+import time
+import logging
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from snapshot_store import SnapshotStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("materialize")
+
+DATA_DIR = os.getenv("DOWNLOAD_DIR", "./data/images")
+MATERIALIZE_WORKERS = int(os.getenv("MATERIALIZE_WORKERS", "2"))
+MATERIALIZE_CHUNK = int(os.getenv("MATERIALIZE_CHUNK", "64"))
+
+def _init_worker(threads):
+    # split the cores between workers instead of every process grabbing all of them
+    import torch
+    torch.set_num_threads(threads)
+
+def _extract_chunk(paths):
+    from image_features import extract_features_batch
+    counts, embeddings = extract_features_batch(list(paths))
+    return counts, embeddings
+
+def materialize(store=None, directory=DATA_DIR, workers=MATERIALIZE_WORKERS, chunk_size=MATERIALIZE_CHUNK):
+    """
+    Run the batched extractor over every archived snapshot that has no features yet
+    and store (vehicle_count, embedding) in the snapshot store.
+
+    Resumable: each chunk is committed as soon as it finishes, and already
+    processed snapshots (or byte-identical copies of them) are skipped.
+    Returns the number of snapshots extracted.
+    """
+    from image_features import profile_signature, EMBEDDING_DIM
+    store = store or SnapshotStore()
+    store.check_profile(profile_signature(), EMBEDDING_DIM)
+    store.ingest_directory(directory)
+    shared = store.share_features_by_hash()
+    if shared:
+        logger.info("Reused features for %d duplicate images", shared)
+    todo = store.query(with_features=False)
+    # one extraction per distinct image; duplicates pick up the result afterwards
+    _, first = np.unique(todo["content_hash"].astype(str), return_index=True)
+    first.sort()
+    ids, paths = todo["id"][first], todo["path"][first]
+    if len(ids) == 0:
+        logger.info("All %d snapshots already materialized", len(store))
+        return 0
+    chunks = [(ids[i:i + chunk_size], paths[i:i + chunk_size]) for i in range(0, len(ids), chunk_size)]
+    logger.info("Materializing %d images in %d chunks with %d workers", len(ids), len(chunks), workers)
+    t0 = time.perf_counter()
+    done = 0
+
+    def commit(chunk_ids, result):
+        nonlocal done
+        counts, embeddings = result
+        store.set_features(chunk_ids, counts, embeddings)
+        done += len(chunk_ids)
+        rate = done / max(time.perf_counter() - t0, 1e-9)
+        logger.info("%d/%d images (%.1f img/s)", done, len(ids), rate)
+
+    if workers <= 1:
+        for chunk_ids, chunk_paths in chunks:
+            commit(chunk_ids, _extract_chunk(chunk_paths))
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        # spawn: forking a process that already runs torch threads can deadlock
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(threads,)) as pool:
+            futures = [(chunk_ids, pool.submit(_extract_chunk, chunk_paths)) for chunk_ids, chunk_paths in chunks]
+            for chunk_ids, future in futures:
+                commit(chunk_ids, future.result())
+    store.share_features_by_hash()
+    logger.info("Materialized %d images in %.1fs", done, time.perf_counter() - t0)
+    return done
+
+if __name__ == "__main__":
+    materialize()
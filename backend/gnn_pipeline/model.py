@@ -1,6 +1,7 @@
 # backend/gnn_pipeline/model.py
 import torch
 import torch.nn.functional as F
+from typing import Optional
 from torch_geometric.nn import SAGEConv, global_mean_pool
 import os
 
@@ -17,7 +18,8 @@ class GraphSageNet(torch.nn.Module):
             torch.nn.ReLU(),
             torch.nn.Linear(hidden_channels//2, out_dim)
         )
-    def forward(self, x, edge_index, batch=None):
+    def forward(self, x: torch.Tensor, edge_index: torch.Tensor, batch: Optional[torch.Tensor] = None):
+        # annotated so the module compiles with torch.jit.script (see export.py)
         # x: node features
         for conv in self.convs:
             x = conv(x, edge_index)
@@ -0,0 +1,126 @@
+# backend/gnn_pipeline/model_executor.py
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import torch
+
+# All model work (decode, YOLO, MobileNet, GNN) runs on this pool instead of the event
+# loop, so /status, /ready and /data/* stay responsive while inference is busy.
+#   MODEL_WORKERS        pool threads (1 = batches run back to back and never fight for cores)
+#   MODEL_TORCH_THREADS  torch intra-op threads for the process (0 = torch default);
+#                        leaving a core free keeps the event loop and HTTP I/O snappy
+#   MODEL_MAX_PENDING    heavy requests admitted at once (running + queued); beyond it -> 503
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", "1"))
+MODEL_TORCH_THREADS = int(os.getenv("MODEL_TORCH_THREADS", "0"))
+MODEL_MAX_PENDING = int(os.getenv("MODEL_MAX_PENDING", "32"))
+
+
+class ExecutorBusy(RuntimeError):
+    """Raised by admit() when the model queue is full; served as 503 with Retry-After"""
+
+    def __init__(self, pending, retry_after):
+        super().__init__(f"model queue full ({pending} requests pending)")
+        self.pending = pending
+        self.retry_after = retry_after
+
+
+def _init_thread(torch_threads):
+    if torch_threads > 0:
+        # process-wide setting; set from the pool so importing this module has no side effects
+        torch.set_num_threads(torch_threads)
+
+
+class ModelExecutor:
+    """
+    Thread pool for model work with admission control.
+
+    Requests enter through admit() (which rejects once max_pending requests are
+    in flight) and run their blocking calls with `await run(fn, ...)`.
+    """
+
+    def __init__(self, workers=MODEL_WORKERS, max_pending=MODEL_MAX_PENDING, torch_threads=MODEL_TORCH_THREADS):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.torch_threads = torch_threads
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="model",
+                                        initializer=_init_thread, initargs=(torch_threads,))
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.calls = 0
+        self.busy_s = 0.0
+        self._mean_request_s = None  # EWMA of admitted request duration, for Retry-After
+
+    def retry_after(self):
+        # seconds until a slot is likely free: about one typical request duration
+        return max(1, math.ceil(self._mean_request_s or 1.0))
+
+    @contextmanager
+    def admit(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise ExecutorBusy(self.pending, self.retry_after())
+            self.pending += 1
+            self.admitted += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.pending -= 1
+                self._mean_request_s = elapsed if self._mean_request_s is None else 0.8 * self._mean_request_s + 0.2 * elapsed
+
+    def _timed(self, fn, args, kwargs):
+        with self._lock:
+            self.running += 1
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.calls += 1
+                self.busy_s += time.perf_counter() - started
+
+    def submit(self, fn, *args, **kwargs):
+        # fire-and-forget variant for non-async callers; returns a concurrent.futures.Future
+        return self._pool.submit(self._timed, fn, args, kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._timed, fn, args, kwargs)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "torch_threads": self.torch_threads or torch.get_num_threads(),
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "running": self.running,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "calls": self.calls,
+                "busy_s": round(self.busy_s, 3),
+                "mean_request_ms": round(1000 * self._mean_request_s, 1) if self._mean_request_s else None,
+            }
+
+
+model_executor = ModelExecutor()
+
+
+async def model_admission():
+    # FastAPI dependency for heavy routes: holds a model_executor slot for the whole request
+    with model_executor.admit():
+        yield
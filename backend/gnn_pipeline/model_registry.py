@@ -0,0 +1,176 @@
+# backend/gnn_pipeline/model_registry.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import torch
+from .model import GraphSageNet
+
+logger = logging.getLogger("model_registry")
+
+
+def _file_sha256(path, chunk_size=1024*1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class _Entry:
+    __slots__ = ("model", "mtime_ns", "size", "sha256", "load_seconds", "loaded_at")
+
+    def __init__(self, model, mtime_ns, size, sha256, load_seconds):
+        self.model = model
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.sha256 = sha256
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of GraphSageNet variants keyed by
+    (weights path, in_channels, hidden_channels), plus exported TorchScript
+    artifacts keyed by their path.
+
+    Each variant is built and deserialized once and kept in eval mode.
+    Every lookup stats the weights file; if mtime/size moved, the file is
+    hashed and the model is hot-swapped only when the content changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._digests = {}
+        self._export_meta = {}
+        self._failed = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _lookup(self, key, path, build):
+        # shared stat -> hash -> (re)build logic; build(path) returns the ready model
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                self.hits += 1
+                return entry.model
+            if self._failed.get(key) == (st.st_mtime_ns, st.st_size):
+                raise RuntimeError(f"{path} failed to load; waiting for the file to change")
+            digest = _file_sha256(path)
+            if entry is not None and entry.sha256 == digest:
+                # file was touched/rewritten with identical weights: keep the resident model
+                entry.mtime_ns, entry.size = st.st_mtime_ns, st.st_size
+                self.hits += 1
+                return entry.model
+            if entry is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+            t0 = time.perf_counter()
+            try:
+                model = build(path)
+            except Exception:
+                self._failed[key] = (st.st_mtime_ns, st.st_size)
+                raise
+            self._failed.pop(key, None)
+            elapsed = time.perf_counter() - t0
+            self._entries[key] = _Entry(model, st.st_mtime_ns, st.st_size, digest, elapsed)
+            logger.info("Loaded GNN %s (%s, sha256=%s) in %.3fs [%s]",
+                        path, key[1:], digest[:12], elapsed,
+                        "reload" if entry is not None else "cold")
+            return model
+
+    def get(self, path, in_channels, hidden_channels=128):
+        path = os.path.abspath(path)
+
+        def build(p):
+            model = GraphSageNet(in_channels, hidden_channels=hidden_channels)
+            model.load_state_dict(torch.load(p, map_location="cpu"))
+            model.eval()
+            return model
+
+        return self._lookup((path, int(in_channels), int(hidden_channels)), path, build)
+
+    def get_exported(self, path, source_path, in_channels):
+        """
+        Exported (TorchScript) model from export.py, or None when the artifact
+        does not match: built for other in_channels, or from weights other than
+        the current content of source_path (e.g. training published new ones).
+        """
+        path, source_path = os.path.abspath(path), os.path.abspath(source_path)
+
+        def build(p):
+            extra = {"meta.json": ""}
+            model = torch.jit.load(p, map_location="cpu", _extra_files=extra)
+            model.eval()
+            self._export_meta[p] = json.loads(extra["meta.json"] or "{}")
+            return model
+
+        st = os.stat(path)
+        with self._lock:
+            if self._failed.get((path, "exported")) == (st.st_mtime_ns, st.st_size):
+                return None  # already reported; retried once the file changes
+        model = self._lookup((path, "exported"), path, build)
+        with self._lock:
+            meta = self._export_meta.get(path, {})
+        if meta.get("in_channels") != int(in_channels):
+            return None
+        if meta.get("source_sha256") != self.file_digest(source_path):
+            return None
+        return model
+
+    def file_digest(self, path):
+        # sha256 of a file, cached on (mtime, size)
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            digest = _file_sha256(path)
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    def is_loaded(self, path, in_channels=None, hidden_channels=128, exported=False):
+        if exported:
+            key = (os.path.abspath(path), "exported")
+        else:
+            key = (os.path.abspath(path), int(in_channels), int(hidden_channels))
+        with self._lock:
+            return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self._export_meta.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "variants": [
+                    {
+                        "path": key[0],
+                        "kind": "exported" if key[1] == "exported" else "eager",
+                        "in_channels": self._export_meta.get(key[0], {}).get("in_channels") if key[1] == "exported" else key[1],
+                        "hidden_channels": None if key[1] == "exported" else key[2],
+                        "sha256": e.sha256,
+                        "load_seconds": round(e.load_seconds, 4),
+                        "loaded_at": e.loaded_at,
+                    }
+                    for key, e in self._entries.items()
+                ],
+            }
+
+
+# single registry shared by every router/worker thread in this process
+registry = ModelRegistry()
@@ -0,0 +1,379 @@
+# backend/gnn_pipeline/snapshot_store.py
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger("snapshot_store")
+
+EMBEDDING_DIM = 1280
+SNAPSHOT_STORE_DIR = os.getenv("SNAPSHOT_STORE_DIR", "./data/snapshot_store")
+INITIAL_CAPACITY = 1024
+LEGACY_PROFILE = "mobilenet_v2/224/fp32"
+
+# CameraID_2025-11-14T20-36-27.504743.jpg or CameraID_2025-11-14T20-36-27+08-00.jpg
+# (download_images replaces ':' with '-', including inside the UTC offset)
+_FILENAME_RE = re.compile(r"^(?P<cam>[^_]+)_(?P<date>\d{4}-\d{2}-\d{2})T(?P<h>\d{2})-(?P<m>\d{2})-(?P<s>\d{2}(?:\.\d+)?)(?P<tz>.*)$")
+_TZ_RE = re.compile(r"^([+-]\d{2})-(\d{2})$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    camera_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    ts_epoch REAL,
+    path TEXT NOT NULL UNIQUE,
+    content_hash TEXT,
+    latitude REAL,
+    longitude REAL,
+    vehicle_count INTEGER,
+    embedding_offset INTEGER
+);
+CREATE INDEX IF NOT EXISTS snapshots_time ON snapshots (ts_epoch);
+CREATE INDEX IF NOT EXISTS snapshots_camera_time ON snapshots (camera_id, ts_epoch);
+CREATE INDEX IF NOT EXISTS snapshots_hash ON snapshots (content_hash);
+CREATE TABLE IF NOT EXISTS cameras (
+    camera_id TEXT PRIMARY KEY,
+    latitude REAL,
+    longitude REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+COLUMNS = ("id", "camera_id", "timestamp", "ts_epoch", "path", "content_hash",
+           "latitude", "longitude", "vehicle_count", "embedding_offset")
+
+
+def file_hash(path):
+    # same digest as feature_cache.content_key(bytes), so the two can share keys
+    with open(path, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=20).hexdigest()
+
+
+def parse_snapshot_name(name):
+    """(camera_id, ISO timestamp) from a CameraID_timestamp.jpg filename, or None"""
+    m = _FILENAME_RE.match(Path(name).stem)
+    if m is None:
+        return None
+    tz = _TZ_RE.sub(r"\1:\2", m["tz"])
+    return m["cam"], f"{m['date']}T{m['h']}:{m['m']}:{m['s']}{tz}"
+
+
+def _epoch(timestamp):
+    try:
+        return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class SnapshotStore:
+    """
+    Index of the camera image archive.
+
+    One SQLite row per snapshot (camera_id, timestamp, path, content hash,
+    lat/lon, vehicle_count, embedding offset) plus an N x EMBEDDING_DIM
+    float32 matrix in embeddings.npy that is memory-mapped for reads, so time
+    windows and camera subsets can be selected without globbing the image
+    directory or decoding JPEGs again.
+    """
+
+    def __init__(self, root=SNAPSHOT_STORE_DIR, embedding_dim=EMBEDDING_DIM):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.embeddings_path = self.root / "embeddings.npy"
+        self._lock = threading.RLock()
+        # generous busy timeout: another process may hold the write lock while it grows the matrix
+        self._conn = sqlite3.connect(str(self.root / "manifest.sqlite"), check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._matrix = None
+        self._matrix_key = None  # (inode, size) of the mapped embeddings.npy
+        # the width recorded with the stored embeddings wins over the constructor default
+        self.embedding_dim = int(self._meta("embedding_dim", embedding_dim))
+
+    def close(self):
+        with self._lock:
+            self._matrix = self._matrix_key = None
+            self._conn.close()
+
+    # ---- embedding matrix ----
+
+    def _meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    @property
+    def embedding_rows(self):
+        return int(self._meta("embedding_rows", 0))
+
+    @property
+    def embedding_profile(self):
+        return self._meta("embedding_profile")
+
+    def check_profile(self, signature, embedding_dim):
+        """
+        Bind the store to one embedding space (image_features.profile_signature()).
+        An empty store adopts it; a store holding embeddings of another profile
+        raises, since mixing them would silently corrupt training data.
+        """
+        with self._lock:
+            rows = self.embedding_rows
+            # stores written before profiles existed hold full-profile embeddings
+            current = self.embedding_profile or (LEGACY_PROFILE if rows else None)
+            if current == signature and self.embedding_dim == embedding_dim and self.embedding_profile:
+                return
+            if rows and (current != signature or self.embedding_dim != embedding_dim):
+                raise ValueError(f"snapshot store {self.root} holds {current} embeddings ({self.embedding_dim}-d), "
+                                 f"current profile is {signature} ({embedding_dim}-d); use another SNAPSHOT_STORE_DIR")
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                       [("embedding_profile", signature), ("embedding_dim", str(embedding_dim))])
+            if self.embedding_dim != embedding_dim:
+                # nothing stored yet: drop the pre-allocated matrix of the old width
+                self._matrix = self._matrix_key = None
+                if self.embeddings_path.exists():
+                    os.remove(self.embeddings_path)
+            self.embedding_dim = embedding_dim
+
+    def _file_key(self):
+        try:
+            st = os.stat(self.embeddings_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size
+
+    def _open_matrix(self, min_rows=0):
+        # (re)map embeddings.npy, growing it by doubling when more rows are needed. Another
+        # process may have grown (replaced) the file since it was mapped, so the map is
+        # refreshed whenever the file's inode or size changes
+        key = self._file_key()
+        if key != self._matrix_key:
+            self._matrix = np.load(self.embeddings_path, mmap_mode="r+") if key else None
+            self._matrix_key = key
+        capacity = len(self._matrix) if self._matrix is not None else 0
+        if capacity < max(min_rows, 1):
+            new_capacity = max(min_rows, capacity * 2, INITIAL_CAPACITY)
+            tmp = self.embeddings_path.with_name(self.embeddings_path.name + ".part")
+            grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32,
+                                              shape=(new_capacity, self.embedding_dim))
+            if capacity:
+                grown[:capacity] = self._matrix
+            grown.flush()
+            del grown
+            os.replace(tmp, self.embeddings_path)
+            self._matrix = np.load(self.embeddings_path, mmap_mode="r+")
+            self._matrix_key = self._file_key()
+        return self._matrix
+
+    def embeddings(self, offsets):
+        """Embedding rows for the given offsets, read through the memory map"""
+        offsets = np.asarray(offsets, dtype=np.int64)
+        with self._lock:
+            if len(offsets) == 0:
+                return np.empty((0, self.embedding_dim), dtype=np.float32)
+            return np.asarray(self._open_matrix(int(offsets.max()) + 1)[offsets])
+
+    # ---- writes ----
+
+    def add(self, camera_id, timestamp, path, content_hash=None, latitude=None, longitude=None):
+        """Register one snapshot (no-op if the path is already indexed); returns its id"""
+        return self.add_many([{
+            "camera_id": camera_id, "timestamp": timestamp, "path": path,
+            "content_hash": content_hash, "latitude": latitude, "longitude": longitude,
+        }])[0]
+
+    def add_many(self, snapshots):
+        """Register snapshot dicts (camera_id, timestamp, path[, content_hash, latitude, longitude])"""
+        rows = []
+        for s in snapshots:
+            path = str(Path(s["path"]).resolve())
+            rows.append((str(s["camera_id"]), str(s["timestamp"]), _epoch(s["timestamp"]), path,
+                         s.get("content_hash") or file_hash(path), s.get("latitude"), s.get("longitude")))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO snapshots (camera_id, timestamp, ts_epoch, path, content_hash, latitude, longitude) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            located = [(r[0], r[5], r[6]) for r in rows if r[5] is not None and r[6] is not None]
+            if located:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cameras (camera_id, latitude, longitude) VALUES (?, ?, ?)", located)
+            return [self._conn.execute("SELECT id FROM snapshots WHERE path = ?", (r[3],)).fetchone()[0]
+                    for r in rows]
+
+    def ingest_directory(self, directory):
+        """
+        Index every CameraID_timestamp.jpg under directory not already in the store.
+        Files whose name has no parseable timestamp are counted and logged, not indexed.
+        """
+        self._repair_epochs()
+        known = {row[0] for row in self._conn.execute("SELECT path FROM snapshots")}
+        new, unparsed = [], []
+        for f in sorted(Path(directory).glob("*.jpg")):
+            path = str(f.resolve())
+            if path in known:
+                continue
+            parsed = parse_snapshot_name(f.name)
+            if parsed is None or _epoch(parsed[1]) is None:
+                unparsed.append(f.name)
+                continue
+            new.append({"camera_id": parsed[0], "timestamp": parsed[1], "path": path})
+        if unparsed:
+            logger.warning("Skipped %d files in %s without a parseable CameraID_timestamp name (e.g. %s)",
+                           len(unparsed), directory, unparsed[0])
+        if new:
+            self.add_many(new)
+            logger.info("Indexed %d new snapshots from %s", len(new), directory)
+        return len(new)
+
+    def _repair_epochs(self):
+        # rows indexed before UTC offsets in filenames were parsed have no ts_epoch
+        rows = self._conn.execute("SELECT id, path FROM snapshots WHERE ts_epoch IS NULL").fetchall()
+        fixed = []
+        for snapshot_id, path in rows:
+            parsed = parse_snapshot_name(Path(path).name)
+            epoch = _epoch(parsed[1]) if parsed else None
+            if epoch is not None:
+                fixed.append((parsed[1], epoch, snapshot_id))
+        if fixed:
+            with self._lock, self._conn:
+                self._conn.executemany("UPDATE snapshots SET timestamp = ?, ts_epoch = ? WHERE id = ?", fixed)
+            logger.info("Recovered timestamps of %d snapshots", len(fixed))
+        if len(rows) > len(fixed):
+            logger.warning("%d snapshots still have no parseable timestamp", len(rows) - len(fixed))
+
+    def set_camera_locations(self, locations):
+        """locations: {camera_id: (lat, lon)}; fills lat/lon on every snapshot of those cameras"""
+        rows = [(str(c), float(lat), float(lon)) for c, (lat, lon) in locations.items()]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cameras (camera_id, latitude, longitude) VALUES (?, ?, ?)", rows)
+            self._conn.executemany(
+                "UPDATE snapshots SET latitude = ?, longitude = ? WHERE camera_id = ?",
+                [(lat, lon, c) for c, lat, lon in rows])
+
+    def set_features(self, snapshot_ids, vehicle_counts, embeddings):
+        """Store extractor output for snapshots; embeddings are appended to the matrix"""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.embedding_dim)
+        ids = [int(i) for i in snapshot_ids]
+        with self._lock:
+            # BEGIN IMMEDIATE takes SQLite's write lock up front: writers in other processes
+            # (the downloader, materialize) wait here, so row ranges and matrix growth never overlap
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                start = self.embedding_rows
+                end = start + len(ids)
+                matrix = self._open_matrix(end)
+                matrix[start:end] = embeddings
+                matrix.flush()
+                # offsets only become visible once the rows are on disk
+                self._conn.executemany(
+                    "UPDATE snapshots SET vehicle_count = ?, embedding_offset = ? WHERE id = ?",
+                    [(int(vc), start + j, i) for j, (i, vc) in enumerate(zip(ids, vehicle_counts))])
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedding_rows', ?)", (str(end),))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def share_features_by_hash(self):
+        """Point snapshots without features at the features of a byte-identical snapshot"""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE snapshots SET (vehicle_count, embedding_offset) = ("
+                "  SELECT d.vehicle_count, d.embedding_offset FROM snapshots d"
+                "  WHERE d.content_hash = snapshots.content_hash AND d.embedding_offset IS NOT NULL LIMIT 1"
+                ") WHERE embedding_offset IS NULL AND content_hash IN ("
+                "  SELECT content_hash FROM snapshots WHERE embedding_offset IS NOT NULL)")
+            return cur.rowcount
+
+    # ---- reads ----
+
+    def _select(self, camera_ids=None, start=None, end=None, with_features=None, latest_per_camera=False):
+        where, params = [], []
+        if camera_ids is not None:
+            camera_ids = [str(c) for c in camera_ids]
+            where.append(f"s.camera_id IN ({','.join('?' * len(camera_ids))})")
+            params.extend(camera_ids)
+        if start is not None:
+            where.append("s.ts_epoch >= ?")
+            params.append(_epoch(start))
+        if end is not None:
+            where.append("s.ts_epoch <= ?")
+            params.append(_epoch(end))
+        if with_features is not None:
+            where.append("s.embedding_offset IS " + ("NOT NULL" if with_features else "NULL"))
+        if latest_per_camera:
+            where.append("s.ts_epoch = (SELECT MAX(ts_epoch) FROM snapshots WHERE camera_id = s.camera_id)")
+        sql = ("SELECT s.id, s.camera_id, s.timestamp, s.ts_epoch, s.path, s.content_hash, "
+               "COALESCE(s.latitude, c.latitude), COALESCE(s.longitude, c.longitude), "
+               "s.vehicle_count, s.embedding_offset "
+               "FROM snapshots s LEFT JOIN cameras c ON c.camera_id = s.camera_id")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY s.ts_epoch, s.camera_id"
+        return sql, params
+
+    @staticmethod
+    def _columns(rows):
+        cols = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+        out = {}
+        for name, values in zip(COLUMNS, cols):
+            if name in ("camera_id", "timestamp", "path", "content_hash"):
+                out[name] = np.array(values, dtype=object)
+            elif name in ("id", "vehicle_count", "embedding_offset"):
+                out[name] = np.array([-1 if v is None else v for v in values], dtype=np.int64)
+            else:
+                out[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        return out
+
+    def query(self, camera_ids=None, start=None, end=None, with_features=None, latest_per_camera=False):
+        """
+        Select snapshots as a columnar dict of numpy arrays (keys: COLUMNS).
+        start/end are ISO timestamps (inclusive); with_features=True/False keeps
+        only rows that have/lack extracted features; latest_per_camera keeps the
+        newest snapshot of each camera.
+        """
+        sql, params = self._select(camera_ids, start, end, with_features, latest_per_camera)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return self._columns(rows)
+
+    def iter_query(self, chunk_rows=10000, **filters):
+        """Same selection as query(), streamed in time order as columnar chunks of chunk_rows"""
+        sql, params = self._select(**filters)
+        # separate connection so a long scan neither holds the lock nor sees half-written batches
+        conn = sqlite3.connect(str(self.root / "manifest.sqlite"))
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield self._columns(rows)
+        finally:
+            conn.close()
+
+    def camera_ids(self, with_features=None):
+        """Distinct camera ids in the archive, sorted"""
+        sql = "SELECT DISTINCT camera_id FROM snapshots"
+        if with_features is not None:
+            sql += " WHERE embedding_offset IS " + ("NOT NULL" if with_features else "NULL")
+        with self._lock:
+            return sorted(row[0] for row in self._conn.execute(sql))
+
+    def camera_locations(self):
+        with self._lock:
+            return {c: (lat, lon) for c, lat, lon in self._conn.execute("SELECT * FROM cameras")}
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
@@ -1,13 +1,17 @@
 # backend/gnn_pipeline/train.py
 import os
-import glob
+import time
+import argparse
+import random
+import pathlib
 import numpy as np
 import torch
 from torch_geometric.loader import DataLoader
-from image_features import extract_features
-from graph_builder import build_graph
-from dataset import TrafficGraphDataset
+from graph_builder import neighbour_topology, node_features
+from dataset import ShardedGraphDataset, read_shard_meta, write_graph_shards
 from model import GraphSageNet
+from snapshot_store import SnapshotStore
+from materialize import materialize
 from datetime import datetime
 import logging
 
@@ -15,73 +19,278 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("train")
 
 DATA_DIR = os.getenv("DOWNLOAD_DIR", "./data/images")
+# snapshots within +-TRAIN_BUCKET_SECONDS of each other form one graph (one LTA poll)
+BUCKET_SECONDS = float(os.getenv("TRAIN_BUCKET_SECONDS", "30"))
+BATCH_SIZE = int(os.getenv("TRAIN_BATCH_SIZE", "8"))
+GRAPH_SHARD_DIR = os.getenv("GRAPH_SHARD_DIR", "./data/graph_shards")
+GRAPH_SHARD_SIZE = int(os.getenv("GRAPH_SHARD_SIZE", "1024"))
+NUM_WORKERS = int(os.getenv("TRAIN_NUM_WORKERS", "2"))
+PREFETCH_FACTOR = int(os.getenv("TRAIN_PREFETCH_FACTOR", "4"))
+PIN_MEMORY = os.getenv("TRAIN_PIN_MEMORY", "0") == "1"
+NUM_THREADS = int(os.getenv("TRAIN_NUM_THREADS", "0"))
+INTEROP_THREADS = int(os.getenv("TRAIN_INTEROP_THREADS", "0"))
+ACCUM_STEPS = int(os.getenv("TRAIN_ACCUM_STEPS", "1"))
+VAL_FRACTION = float(os.getenv("TRAIN_VAL_FRACTION", "0.2"))
+PATIENCE = int(os.getenv("TRAIN_PATIENCE", "5"))
+CHECKPOINT_DIR = os.getenv("TRAIN_CHECKPOINT_DIR", "./data/checkpoints")
+CHECKPOINT_EVERY = int(os.getenv("TRAIN_CHECKPOINT_EVERY", "1"))
+HIDDEN_CHANNELS = 128
+# same resolution as inference.MODEL_PATH, which the serving registry watches
+MODEL_PATH = os.getenv("GNN_MODEL_PATH", str(pathlib.Path(__file__).resolve().parent.parent / "gnn_model.pt"))
 
-def collect_camera_snapshots(pattern="*.jpg"):
-    # we assume filenames like CameraID_timestamp.jpg
-    files = glob.glob(os.path.join(DATA_DIR, "*.jpg"))
-    cam_map = {}
-    for f in files:
-        base = os.path.basename(f)
-        try:
-            cam_id, ts = base.split("_", 1)
-        except:
-            continue
-        cam_map.setdefault(cam_id, []).append((f, ts))
-    return cam_map
-
-def build_graphs_from_data(max_graphs=100):
-    cam_snapshots = collect_camera_snapshots()
-    # For simplicity, create graph per timestamp across cameras that have similar timestamps.
-    # Here we just take latest snapshot per camera.
-    cameras = []
-    for cam_id, snaps in cam_snapshots.items():
-        snaps_sorted = sorted(snaps, key=lambda x: x[1], reverse=True)
-        path, ts = snaps_sorted[0]
-        vc, emb = extract_features(path)
-        # produce camera dict
-        # NOTE: You should map/from LTA feed metadata to lat/lon; for demo we set zeros
-        cameras.append({
-            "CameraID": cam_id,
-            "Latitude": 0.0,
-            "Longitude": 0.0,
-            "vehicle_count": vc,
-            "embedding": emb,
-            "Timestamp": ts
-        })
-    # If insufficient cameras, fail
-    if len(cameras) < 2:
+def camera_topology(store, k=4):
+    # static node order (one node per camera with features) and its k-NN edges
+    cam_ids = store.camera_ids(with_features=True)
+    if len(cam_ids) < 2:
         raise RuntimeError("Not enough cameras for training graph")
-    # Build one graph from all cameras
-    x, edge_index = build_graph(cameras, k=4)
-    # label: heuristic average vehicle_count normalized to 0-1
-    avg_vc = np.mean([c["vehicle_count"] for c in cameras])
-    y = torch.tensor([float(min(1.0, avg_vc / 200.0))], dtype=torch.float)  # example scaling
-    return [(x, edge_index, y)]
-
-def train_main(epochs=50):
-    graphs = build_graphs_from_data()
-    dataset = TrafficGraphDataset(graphs)
-    loader = DataLoader(dataset, batch_size=1, shuffle=True)
+    # lat/lon come from the LTA camera feed (recorded by download_images); 0 if never seen
+    locations = store.camera_locations()
+    coords = np.array([locations.get(c, (0.0, 0.0)) for c in cam_ids], dtype=np.float64)
+    coords = np.nan_to_num(coords)
+    edge_index = neighbour_topology(cam_ids, coords, k=k)[0]
+    return cam_ids, coords, edge_index
+
+def iter_snapshot_graphs(store, cam_ids, coords, window_s=BUCKET_SECONDS):
+    """
+    Stream one graph per time bucket (one LTA poll) in time order.
+
+    A bucket opens at the earliest unassigned snapshot and takes every
+    snapshot up to 2*window_s later (all within +-window_s of its centre).
+    A camera missing from a bucket carries its previous snapshot forward;
+    buckets before every camera has been seen are skipped. Yields
+    (ts_epoch, node_scalars [N,5], embedding_offsets [N], y) and only holds
+    the current bucket in memory.
+    """
+    node = {c: i for i, c in enumerate(cam_ids)}
+    offsets = np.full(len(cam_ids), -1, dtype=np.int64)
+    counts = np.zeros(len(cam_ids), dtype=np.float32)
+    stamps = np.empty(len(cam_ids), dtype=object)
+    opened = last = None
+
+    def close():
+        if (offsets < 0).any():
+            return None  # some camera not seen yet
+        # columns 0-4 of node_features; the embedding columns are looked up by offset
+        scalars = node_features(counts, list(stamps), coords, np.empty((len(counts), 0)), dim=0)
+        # label: heuristic average vehicle_count normalized to 0-1
+        y = float(min(1.0, counts.mean() / 200.0))  # example scaling
+        return last, scalars, offsets.copy(), y
+
+    for chunk in store.iter_query(with_features=True):
+        for cam, ts, t, vc, off in zip(chunk["camera_id"], chunk["timestamp"], chunk["ts_epoch"],
+                                       chunk["vehicle_count"], chunk["embedding_offset"]):
+            if np.isnan(t):
+                continue
+            if opened is not None and t > opened + 2 * window_s:
+                g = close()
+                if g is not None:
+                    yield g
+                opened = None
+            if opened is None:
+                opened = t
+            # rows arrive in time order, so the latest snapshot of each camera in a bucket wins
+            i = node[cam]
+            offsets[i], counts[i], stamps[i], last = off, vc, ts, t
+    if opened is not None:
+        g = close()
+        if g is not None:
+            yield g
+
+def prepare_graph_shards(root=GRAPH_SHARD_DIR, window_s=BUCKET_SECONDS, k=4, shard_size=GRAPH_SHARD_SIZE):
+    """
+    Materialize features, then write the snapshot graphs of the whole archive
+    to on-disk shards. Shards are reused as long as the archive and the
+    graph parameters are unchanged. Returns the shard directory.
+    """
+    store = SnapshotStore()
+    materialize(store, DATA_DIR)
+    signature = {
+        "snapshots": len(store),
+        "embedding_rows": store.embedding_rows,
+        "embedding_profile": store.embedding_profile,
+        "window_s": window_s,
+        "k": k,
+    }
+    meta = read_shard_meta(root)
+    if meta is not None and meta.get("signature") == signature:
+        logger.info("Reusing %d graph shards in %s", len(meta["shard_sizes"]), root)
+        return root
+    t0 = time.perf_counter()
+    cam_ids, coords, edge_index = camera_topology(store, k=k)
+    n = write_graph_shards(root, iter_snapshot_graphs(store, cam_ids, coords, window_s), edge_index,
+                           store.embeddings_path, meta={"signature": signature, "cameras": cam_ids},
+                           shard_size=shard_size)
+    if n == 0:
+        raise RuntimeError("No time bucket covers every camera")
+    logger.info("Wrote %d snapshot graphs (%d cameras, %d edges, +-%.0fs buckets) to %s in %.1fs",
+                n, len(cam_ids), edge_index.shape[1], window_s, root, time.perf_counter() - t0)
+    return root
+
+def configure_threads(num_threads=NUM_THREADS, interop_threads=INTEROP_THREADS):
+    # 0 keeps torch's default; interop threads can only be set before the first parallel op
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            logger.warning("could not set inter-op threads: %s", e)
+    logger.info("torch threads: intra-op=%d inter-op=%d", torch.get_num_threads(), torch.get_num_interop_threads())
+
+def _init_loader_worker(worker_id):
+    # loader workers only slice memmaps; keep them from competing with the training threads
+    torch.set_num_threads(1)
+
+def _make_loader(dataset, batch_size, shuffle, num_workers, pin_memory):
+    # PyG collates the graphs of a mini-batch into one disjoint graph with a batch vector;
+    # workers assemble upcoming batches from the memory-mapped shards while the model trains
+    return DataLoader(
+        dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+        prefetch_factor=PREFETCH_FACTOR if num_workers > 0 else None,
+        persistent_workers=num_workers > 0,
+        pin_memory=pin_memory,
+        worker_init_fn=_init_loader_worker if num_workers > 0 else None
+    )
+
+def _atomic_save(obj, path):
+    # write next to the target and rename, so readers (and the serving registry) never see a partial file
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.part"
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+def _rng_state():
+    return {"torch": torch.get_rng_state(), "numpy": np.random.get_state(), "python": random.getstate()}
+
+def _set_rng_state(state):
+    torch.set_rng_state(state["torch"])
+    np.random.set_state(state["numpy"])
+    random.setstate(state["python"])
+
+@torch.no_grad()
+def evaluate(model, loader):
+    model.eval()
+    total, graphs = 0.0, 0
+    for data in loader:
+        out = model(data.x, data.edge_index, batch=data.batch)
+        total += torch.nn.functional.mse_loss(out, data.y, reduction="sum").item()
+        graphs += data.num_graphs
+    return total / max(graphs, 1)
+
+def train_main(epochs=50, batch_size=BATCH_SIZE, num_workers=NUM_WORKERS, num_threads=NUM_THREADS,
+               interop_threads=INTEROP_THREADS, accum_steps=ACCUM_STEPS, pin_memory=PIN_MEMORY,
+               val_fraction=VAL_FRACTION, patience=PATIENCE, checkpoint_dir=CHECKPOINT_DIR,
+               checkpoint_every=CHECKPOINT_EVERY, model_path=MODEL_PATH, resume=False, seed=None):
+    configure_threads(num_threads, interop_threads)
+    if seed is not None:
+        torch.manual_seed(seed)
+        np.random.seed(seed)
+        random.seed(seed)
+    dataset = ShardedGraphDataset(prepare_graph_shards())
+    # chronological split: validate on the most recent graphs so no future poll leaks into training
+    n_val = int(len(dataset) * val_fraction) if len(dataset) > 1 else 0
+    train_set = dataset.index_select(list(range(len(dataset) - n_val)))
+    val_set = dataset.index_select(list(range(len(dataset) - n_val, len(dataset))))
+    loader = _make_loader(train_set, batch_size, True, num_workers, pin_memory)
+    val_loader = _make_loader(val_set, batch_size, False, num_workers, pin_memory) if n_val else None
+    logger.info("Training on %d graphs, validating on %d", len(train_set), len(val_set))
+
     in_channels = dataset[0].x.shape[1]
-    model = GraphSageNet(in_channels, hidden_channels=128)
+    model = GraphSageNet(in_channels, hidden_channels=HIDDEN_CHANNELS)
     optim = torch.optim.Adam(model.parameters(), lr=1e-3)
-    for epoch in range(1, epochs+1):
+    last_path = os.path.join(checkpoint_dir, "last.pt")
+    best_path = os.path.join(checkpoint_dir, "best.pt")
+    start_epoch, best_loss, stale_epochs = 1, float("inf"), 0
+    if resume and os.path.exists(last_path):
+        ckpt = torch.load(last_path, map_location="cpu", weights_only=False)
+        if ckpt["in_channels"] != in_channels:
+            raise RuntimeError(f"checkpoint was trained with in_channels={ckpt['in_channels']}, data has {in_channels}")
+        model.load_state_dict(ckpt["model"])
+        optim.load_state_dict(ckpt["optimizer"])
+        _set_rng_state(ckpt["rng"])
+        start_epoch = ckpt["epoch"] + 1
+        best_loss, stale_epochs = ckpt["best_loss"], ckpt["stale_epochs"]
+        logger.info("Resumed from %s at epoch %d (best loss %.6f)", last_path, ckpt["epoch"], best_loss)
+    elif resume:
+        logger.warning("No checkpoint at %s, starting from scratch", last_path)
+
+    for epoch in range(start_epoch, epochs+1):
         model.train()
         total_loss = 0.0
-        for data in loader:
-            optim.zero_grad()
-            out = model(data.x, data.edge_index, batch=batch_from_data(data))
+        graphs = nodes = 0
+        wait = 0.0
+        optim.zero_grad()
+        t0 = t_ready = time.perf_counter()
+        for step, data in enumerate(loader, 1):
+            wait += time.perf_counter() - t_ready
+            out = model(data.x, data.edge_index, batch=data.batch)
             loss = torch.nn.functional.mse_loss(out, data.y)
-            loss.backward()
-            optim.step()
-            total_loss += loss.item()
-        logger.info("Epoch %d loss=%.6f", epoch, total_loss)
-    torch.save(model.state_dict(), "gnn_model.pt")
-    logger.info("Model saved to gnn_model.pt")
+            # gradient accumulation: one optimizer step per accum_steps mini-batches
+            (loss / accum_steps).backward()
+            if step % accum_steps == 0 or step == len(loader):
+                optim.step()
+                optim.zero_grad()
+            total_loss += loss.item() * data.num_graphs
+            graphs += data.num_graphs
+            nodes += data.num_nodes
+            t_ready = time.perf_counter()
+        elapsed = time.perf_counter() - t0
+        train_loss = total_loss / max(graphs, 1)
+        # too few graphs for a validation split: select on training loss
+        val_loss = evaluate(model, val_loader) if val_loader is not None else train_loss
+        logger.info("Epoch %d loss=%.6f val=%.6f | %.1f graphs/s %.0f nodes/s | %.2fs (%.0f%% waiting for data)",
+                    epoch, train_loss, val_loss, graphs / elapsed, nodes / elapsed,
+                    elapsed, 100 * wait / elapsed)
+
+        improved = val_loss < best_loss
+        if improved:
+            best_loss, stale_epochs = val_loss, 0
+            _atomic_save(model.state_dict(), best_path)
+            # publish: the serving registry picks the new weights up on its next lookup
+            _atomic_save(model.state_dict(), model_path)
+            logger.info("New best val=%.6f, published to %s", val_loss, model_path)
+        else:
+            stale_epochs += 1
+        stop = patience > 0 and stale_epochs >= patience
+        if improved or stop or epoch == epochs or epoch % checkpoint_every == 0:
+            _atomic_save({
+                "epoch": epoch,
+                "model": model.state_dict(),
+                "optimizer": optim.state_dict(),
+                "rng": _rng_state(),
+                "best_loss": best_loss,
+                "stale_epochs": stale_epochs,
+                "in_channels": in_channels,
+            }, last_path)
+        if stop:
+            logger.info("Early stopping: no improvement for %d epochs (best val=%.6f)", patience, best_loss)
+            break
+    logger.info("Best model (val=%.6f) at %s", best_loss, model_path)
 
-def batch_from_data(data):
-    # data is a single Data, create batch vector of zeros
-    return torch.zeros(data.x.size(0), dtype=torch.long)
+def parse_args():
+    ap = argparse.ArgumentParser(description="Train the GraphSAGE congestion model on the snapshot archive")
+    ap.add_argument("--epochs", type=int, default=25)
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--workers", type=int, default=NUM_WORKERS, help="DataLoader worker processes")
+    ap.add_argument("--threads", type=int, default=NUM_THREADS, help="torch intra-op threads (0 = default)")
+    ap.add_argument("--interop-threads", type=int, default=INTEROP_THREADS, help="torch inter-op threads (0 = default)")
+    ap.add_argument("--accum-steps", type=int, default=ACCUM_STEPS, help="mini-batches per optimizer step")
+    ap.add_argument("--pin-memory", action="store_true", default=PIN_MEMORY)
+    ap.add_argument("--val-fraction", type=float, default=VAL_FRACTION, help="most recent share of graphs held out")
+    ap.add_argument("--patience", type=int, default=PATIENCE, help="epochs without improvement before stopping (0 = never)")
+    ap.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    ap.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY)
+    ap.add_argument("--model-path", default=MODEL_PATH, help="where the best weights are published for serving")
+    ap.add_argument("--resume", action="store_true", help="continue from <checkpoint-dir>/last.pt")
+    ap.add_argument("--seed", type=int, default=None)
+    return ap.parse_args()
 
 if __name__ == "__main__":
-    train_main(epochs=25)
+    args = parse_args()
+    train_main(epochs=args.epochs, batch_size=args.batch_size, num_workers=args.workers,
+               num_threads=args.threads, interop_threads=args.interop_threads,
+               accum_steps=max(1, args.accum_steps), pin_memory=args.pin_memory,
+               val_fraction=args.val_fraction, patience=args.patience,
+               checkpoint_dir=args.checkpoint_dir, checkpoint_every=max(1, args.checkpoint_every),
+               model_path=args.model_path, resume=args.resume, seed=args.seed)
@@ -1,8 +1,9 @@
 import logging
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 # Load .env
 load_dotenv()
@@ -18,13 +19,16 @@ logging.basicConfig(
 # --------------------------------------------------------
 from backend.routers import status, data, simulate, predict
 from backend.routers.gnn_predict import router as gnn_router
+from backend.api_clients.camera_images import close_client as close_image_client
+from backend.gnn_pipeline.batching import close as close_batchers
+from backend.gnn_pipeline.model_executor import ExecutorBusy, model_executor
 
 # --------------------------------------------------------
 # IMPORT GNN PIPELINE
 # --------------------------------------------------------
 from backend.gnn_pipeline.image_features import extract_features
 from backend.gnn_pipeline.model import GraphSageNet
-from backend.gnn_pipeline.inference import predict_for_snapshot
+from backend.gnn_pipeline.inference import predict_for_snapshot, warmup as warmup_models
 
 # --------------------------------------------------------
 # CREATE APP
@@ -49,10 +53,43 @@ app.add_middleware(
 # --------------------------------------------------------
 # STARTUP
 # --------------------------------------------------------
+# Models load lazily on first use; MODEL_WARMUP=1 (default) loads them in the
+# background right after startup so /ready flips to 200 without a first request.
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+
+def _background_warmup():
+    try:
+        warmup_models()
+        logging.info("✓ Models warmed up.")
+    except Exception as e:
+        logging.exception("Model warm-up failed: %s", e)
+
 @app.on_event("startup")
 async def startup_event():
+    if MODEL_WARMUP:
+        # on the model pool: picks up its torch thread limit and runs ahead of the first request
+        model_executor.submit(_background_warmup)
     logging.info("✓ Backend started successfully.")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_image_client()
+    close_batchers()
+    model_executor.shutdown()
+
+# --------------------------------------------------------
+# BACKPRESSURE
+# --------------------------------------------------------
+# Heavy routes are admitted through model_executor; when its queue is full they
+# are shed with 503 + Retry-After instead of piling up behind running inference.
+@app.exception_handler(ExecutorBusy)
+async def executor_busy_handler(request: Request, exc: ExecutorBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Model queue is full, retry later", "pending": exc.pending},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # --------------------------------------------------------
 # ROUTERS
 # --------------------------------------------------------
@@ -1,23 +1,20 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-from pathlib import Path
 from dotenv import load_dotenv
 import logging
 import os
-import requests
 
 # Use your gnn pipeline (absolute imports)
-from backend.gnn_pipeline.inference import predict_for_snapshot
-from backend.gnn_pipeline.image_features import extract_features
+from backend.api_clients.camera_images import fetch_camera_images
+from backend.gnn_pipeline.inference import predict_scenarios
+from backend.gnn_pipeline.feature_cache import extract_features_cached, fast_key
+from backend.gnn_pipeline.model_executor import model_executor, model_admission
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-TMP_DIR = Path("tmp")
-TMP_DIR.mkdir(exist_ok=True)
-
 # ---------- Request models ----------
 class CameraMeta(BaseModel):
     CameraID: str
@@ -26,9 +23,16 @@ class CameraMeta(BaseModel):
     ImageLink: str
     Timestamp: str
 
+class SweepSpec(BaseModel):
+    start: float = 0.0
+    stop: float = 100.0
+    step: float = 5.0
+
 class SimulateRequest(BaseModel):
     cameras: List[CameraMeta]
     reduce_vehicles_pct: Optional[float] = 0.0  # percentage [0-100], default 0 (no reduction)
+    reduce_vehicles_pcts: Optional[List[float]] = None  # extra scenarios, each a percentage [0-100]
+    sweep: Optional[SweepSpec] = None  # e.g. {"start": 0, "stop": 100, "step": 5}
 
 
 # ---------- Helper: PM2.5 <-> AQI (approximate, US EPA) ----------
@@ -66,113 +70,108 @@ def pm25_category(aqi: int) -> str:
 # Choose a default emission factor (µg/m3 per vehicle). You can tune this later.
 EMISSION_FACTOR = float(os.getenv("EMISSION_FACTOR", "0.05"))  # µg/m3 per vehicle (example)
 
+# Upper bound on scenarios per request (all of them share one batched GNN forward)
+MAX_SCENARIOS = int(os.getenv("SIMULATE_MAX_SCENARIOS", "101"))
+
+
+def scenario_pcts(req: SimulateRequest) -> List[float]:
+    """Baseline (0%), reduce_vehicles_pct, explicit list and sweep, de-duplicated in order"""
+    pcts = [0.0, float(req.reduce_vehicles_pct or 0.0)]
+    pcts += [float(p) for p in (req.reduce_vehicles_pcts or [])]
+    if req.sweep is not None:
+        if req.sweep.step <= 0 or req.sweep.stop < req.sweep.start:
+            raise HTTPException(status_code=400, detail="sweep requires step > 0 and stop >= start")
+        n = int((req.sweep.stop - req.sweep.start) / req.sweep.step + 1e-9) + 1
+        if n > MAX_SCENARIOS:
+            raise HTTPException(status_code=400, detail=f"sweep produces {n} scenarios (max {MAX_SCENARIOS})")
+        pcts += [round(req.sweep.start + i * req.sweep.step, 6) for i in range(n)]
+    for p in pcts:
+        if p < 0 or p > 100:
+            raise HTTPException(status_code=400, detail="reduce_vehicles_pct must be between 0 and 100")
+    pcts = list(dict.fromkeys(pcts))
+    if len(pcts) > MAX_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"Too many scenarios ({len(pcts)}, max {MAX_SCENARIOS})")
+    return pcts
+
+
+def scenario_result(pct: float, congestion: float, total_vehicles: float) -> dict:
+    pm25 = EMISSION_FACTOR * total_vehicles
+    aqi = pm25_to_aqi(pm25)
+    return {
+        "reduce_vehicles_pct": float(pct),
+        "congestion": float(congestion),
+        "total_vehicle_count": float(total_vehicles),
+        "pm25_estimate": float(pm25),
+        "aqi": int(aqi),
+        "aqi_category": pm25_category(aqi)
+    }
+
 
 # ---------- Core endpoint: predict + simulate ----------
-@router.post("/simulate", summary="Predict congestion and simulate AQI change when vehicles reduced")
+@router.post("/simulate", dependencies=[Depends(model_admission)], summary="Predict congestion and simulate AQI change when vehicles reduced")
 async def predict_and_simulate(req: SimulateRequest):
     """
     Accepts a list of cameras (with ImageLink). Downloads images,
-    extracts features (vehicle_count, embedding), runs GNN for baseline congestion,
-    then simulates reducing vehicle counts by reduce_vehicles_pct and re-runs the GNN.
-    Returns baseline & simulated congestion, PM2.5, AQI and categories.
+    extracts features (vehicle_count, embedding), then evaluates the baseline and
+    every requested vehicle-reduction scenario (reduce_vehicles_pct, reduce_vehicles_pcts
+    and/or sweep) in a single batched GNN forward pass.
+    Returns baseline & simulated congestion, PM2.5, AQI and categories, plus a
+    "scenarios" list when more than one reduction was requested.
     """
     if not req.cameras:
         raise HTTPException(status_code=400, detail="No cameras provided")
 
-    temp_files = []
+    # 0) Validate scenarios before doing any downloads
+    pcts = scenario_pcts(req)
+
     camera_dicts = []
 
     try:
-        # 1) Download images and extract features
-        for cam in req.cameras:
-            try:
-                response = requests.get(cam.ImageLink, timeout=15)
-                response.raise_for_status()
-            except Exception as e:
-                logger.error("Failed to download image for %s: %s", cam.CameraID, e)
-                raise HTTPException(status_code=400, detail=f"Failed to download image for {cam.CameraID}: {e}")
-
-            filename = f"{cam.CameraID}_{cam.Timestamp.replace(':','-')}.jpg"
-            file_path = TMP_DIR / filename
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-            temp_files.append(file_path)
-
-            # Use your image_features.extract_features(image_path) -> (vehicle_count, embedding)
-            vehicle_count, embedding = extract_features(str(file_path))
-
+        # Download all camera images concurrently; failed cameras are reported, not fatal
+        fetched, failed = await fetch_camera_images(req.cameras)
+        if not fetched:
+            raise HTTPException(status_code=502, detail={"message": "No camera images could be downloaded", "failed_cameras": failed})
+        cameras = [cam for cam, _ in fetched]
+        images = [img for _, img in fetched]
+
+        # Extract features (vehicle_count, embedding) for all cameras in one batch
+        counts, embeddings = await model_executor.run(
+            extract_features_cached,
+            images, fast_keys=[fast_key(cam.CameraID, cam.Timestamp) for cam in cameras]
+        )
+
+        for cam, vehicle_count, embedding in zip(cameras, counts, embeddings):
             camera_dicts.append({
                 "CameraID": cam.CameraID,
                 "Latitude": cam.Latitude,
                 "Longitude": cam.Longitude,
-                "vehicle_count": vehicle_count,
+                "vehicle_count": int(vehicle_count),
                 "embedding": embedding,
                 "Timestamp": cam.Timestamp
             })
 
-        # 2) Baseline congestion (GNN)
-        baseline_congestion = predict_for_snapshot(camera_dicts)
+        # 2) Baseline + all scenarios in one GNN forward
+        # (approximation: embeddings unchanged, vehicle_count scaled per scenario)
+        scales = [max(0.0, 1.0 - p / 100.0) for p in pcts]
+        congestions = await model_executor.run(predict_scenarios, camera_dicts, scales)
 
-        # 3) Baseline PM2.5 estimate from raw vehicle counts
+        # 3) PM2.5 / AQI per scenario from (scaled) vehicle counts
         total_vehicles = sum([c["vehicle_count"] for c in camera_dicts])
-        baseline_pm25 = EMISSION_FACTOR * total_vehicles
-        baseline_aqi = pm25_to_aqi(baseline_pm25)
-        baseline_aqi_category = pm25_category(baseline_aqi)
-
-        # 4) Simulate reduction
-        pct = float(req.reduce_vehicles_pct or 0.0)
-        if pct < 0 or pct > 100:
-            raise HTTPException(status_code=400, detail="reduce_vehicles_pct must be between 0 and 100")
+        results = {
+            p: scenario_result(p, congestion, total_vehicles * scale)
+            for p, scale, congestion in zip(pcts, scales, congestions)
+        }
 
-        if pct == 0.0:
-            # no change: return baseline only
-            simulated_congestion = baseline_congestion
-            simulated_pm25 = baseline_pm25
-            simulated_aqi = baseline_aqi
-            simulated_aqi_category = baseline_aqi_category
-        else:
-            # Create modified camera dicts with scaled vehicle_count.
-            # We keep embeddings the same (approximation) and scale vehicle_count.
-            scale = max(0.0, 1.0 - pct / 100.0)
-            sim_camera_dicts = []
-            for c in camera_dicts:
-                sim_camera_dicts.append({
-                    "CameraID": c["CameraID"],
-                    "Latitude": c["Latitude"],
-                    "Longitude": c["Longitude"],
-                    # scale the vehicle counts:
-                    "vehicle_count": c["vehicle_count"] * scale,
-                    "embedding": c["embedding"],
-                    "Timestamp": c["Timestamp"]
-                })
-
-            # Simulated congestion via GNN (approximation: embeddings unchanged)
-            simulated_congestion = predict_for_snapshot(sim_camera_dicts)
-
-            # Simulated PM2.5 & AQI
-            simulated_total_vehicles = sum([c["vehicle_count"] for c in sim_camera_dicts])
-            simulated_pm25 = EMISSION_FACTOR * simulated_total_vehicles
-            simulated_aqi = pm25_to_aqi(simulated_pm25)
-            simulated_aqi_category = pm25_category(simulated_aqi)
-
-        # 5) Build response
+        # 4) Build response
+        baseline = dict(results[0.0])
+        baseline.pop("reduce_vehicles_pct")
         response = {
-            "baseline": {
-                "congestion": float(baseline_congestion),
-                "total_vehicle_count": float(total_vehicles),
-                "pm25_estimate": float(baseline_pm25),
-                "aqi": int(baseline_aqi),
-                "aqi_category": baseline_aqi_category
-            },
-            "simulated": {
-                "reduce_vehicles_pct": float(pct),
-                "congestion": float(simulated_congestion),
-                "total_vehicle_count": float(simulated_total_vehicles if pct>0 else total_vehicles),
-                "pm25_estimate": float(simulated_pm25),
-                "aqi": int(simulated_aqi),
-                "aqi_category": simulated_aqi_category
-            }
+            "baseline": baseline,
+            "simulated": results[float(req.reduce_vehicles_pct or 0.0)],
+            "failed_cameras": failed
         }
+        if req.reduce_vehicles_pcts or req.sweep is not None:
+            response["scenarios"] = [results[p] for p in sorted(results)]
 
         return response
 
@@ -182,18 +181,6 @@ async def predict_and_simulate(req: SimulateRequest):
         logger.exception("Simulation failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-    finally:
-        # cleanup
-        for tmp in temp_files:
-            try:
-                os.remove(tmp)
-            except Exception:
-                pass
-
-
-from fastapi import APIRouter
-
-router = APIRouter()
 
 @router.get("/traffic")
 async def get_traffic():
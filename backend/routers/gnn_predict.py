@@ -1,20 +1,19 @@
 # backend/routers/gnn_predict.py
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List
-from pathlib import Path
 from dotenv import load_dotenv
-import requests
 import logging
-import os
 
 # Load .env
 load_dotenv()
 
 # Correct imports (NO relative imports)
-from backend.gnn_pipeline.inference import predict_for_snapshot
-from backend.gnn_pipeline.image_features import extract_features
+from backend.api_clients.camera_images import fetch_camera_images
+from backend.gnn_pipeline.feature_cache import fast_key
+from backend.gnn_pipeline.batching import extract_features_coalesced, predict_snapshot_coalesced
+from backend.gnn_pipeline.model_executor import model_admission
 
 
 
@@ -40,55 +39,41 @@ class PredictRequest(BaseModel):
 # ---------------------------
 # Main Prediction Route
 # ---------------------------
-@router.post("/predict/cameras")
+@router.post("/predict/cameras", dependencies=[Depends(model_admission)])
 async def predict_cameras(req: PredictRequest):
 
-    temp_files = []
     camera_dicts = []
 
     try:
-        tmp_dir = Path("tmp")
-        tmp_dir.mkdir(exist_ok=True)
-
-        for cam in req.cameras:
-
-            # Download image
-            response = requests.get(cam.ImageLink, timeout=15)
-            response.raise_for_status()
-
-            filename = f"{cam.CameraID}_{cam.Timestamp.replace(':','-')}.jpg"
-            file_path = tmp_dir / filename
-
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-
-            # Extract image features
-            vehicle_count, embedding = extract_features(str(file_path))
-
+        # Download all camera images concurrently; failed cameras are reported, not fatal
+        fetched, failed = await fetch_camera_images(req.cameras)
+        if not fetched:
+            raise HTTPException(status_code=502, detail={"message": "No camera images could be downloaded", "failed_cameras": failed})
+        cameras = [cam for cam, _ in fetched]
+        images = [img for _, img in fetched]
+
+        # Extract image features; misses share batches with concurrent requests
+        counts, embeddings = await extract_features_coalesced(
+            images, fast_keys=[fast_key(cam.CameraID, cam.Timestamp) for cam in cameras]
+        )
+
+        for cam, vehicle_count, embedding in zip(cameras, counts, embeddings):
             camera_dicts.append({
                 "CameraID": cam.CameraID,
                 "Latitude": cam.Latitude,
                 "Longitude": cam.Longitude,
-                "vehicle_count": vehicle_count,
+                "vehicle_count": int(vehicle_count),
                 "embedding": embedding,
                 "Timestamp": cam.Timestamp
             })
 
-            temp_files.append(file_path)
+        # Run congestion prediction (forward batched with concurrent requests)
+        congestion_score = await predict_snapshot_coalesced(camera_dicts)
 
-        # Run congestion prediction
-        congestion_score = predict_for_snapshot(camera_dicts)
-
-        return {"congestion": float(congestion_score)}
+        return {"congestion": float(congestion_score), "failed_cameras": failed}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Prediction failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-
-    finally:
-        # Clean up temporary files
-        for tmp in temp_files:
-            try:
-                os.remove(tmp)
-            except:
-                pass
@@ -1,20 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List
-from pathlib import Path
-import os
-import requests
 import logging
 
-from backend.gnn_pipeline.inference import predict_for_snapshot
-from backend.gnn_pipeline.image_features import extract_features
+from backend.api_clients.camera_images import fetch_camera_images
+from backend.gnn_pipeline.feature_cache import fast_key
+from backend.gnn_pipeline.batching import extract_features_coalesced, predict_snapshot_coalesced
+from backend.gnn_pipeline.model_executor import model_admission
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-TMP_DIR = Path("tmp")
-TMP_DIR.mkdir(exist_ok=True)
-
 
 # ----------- Request Models -----------
 class CameraMeta(BaseModel):
@@ -30,53 +26,46 @@ class PredictRequest(BaseModel):
 
 
 # ---------- Prediction Endpoint ----------
-@router.post("/cameras")
+@router.post("/cameras", dependencies=[Depends(model_admission)])
 async def predict_cameras(req: PredictRequest):
     if not req.cameras:
         raise HTTPException(status_code=400, detail="No cameras provided")
 
-    temp_files = []
     camera_dicts = []
 
     try:
-        # Download + extract features
-        for cam in req.cameras:
-            try:
-                headers = {"User-Agent": "Mozilla/5.0"}
-                r = requests.get(cam.ImageLink, timeout=20, headers=headers)
-                r.raise_for_status()
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Failed to download {cam.CameraID}: {e}")
-
-            filename = f"{cam.CameraID}_{cam.Timestamp.replace(':','-')}.jpg"
-            fp = TMP_DIR / filename
-            with open(fp, "wb") as f:
-                f.write(r.content)
-            temp_files.append(fp)
-
-            vehicle_count, embedding = extract_features(str(fp))
-
+        # Download all camera images concurrently; failed cameras are reported, not fatal
+        fetched, failed = await fetch_camera_images(req.cameras)
+        if not fetched:
+            raise HTTPException(status_code=502, detail={"message": "No camera images could be downloaded", "failed_cameras": failed})
+        cameras = [cam for cam, _ in fetched]
+        images = [img for _, img in fetched]
+
+        # Extract features for the whole snapshot in one batch; misses share batches with concurrent requests
+        counts, embeddings = await extract_features_coalesced(
+            images, fast_keys=[fast_key(cam.CameraID, cam.Timestamp) for cam in cameras]
+        )
+
+        for cam, vehicle_count, embedding in zip(cameras, counts, embeddings):
             camera_dicts.append({
                 "CameraID": cam.CameraID,
                 "Latitude": cam.Latitude,
                 "Longitude": cam.Longitude,
-                "vehicle_count": vehicle_count,
+                "vehicle_count": int(vehicle_count),
                 "embedding": embedding,
                 "Timestamp": cam.Timestamp
             })
 
-        # Run GNN
-        congestion = predict_for_snapshot(camera_dicts)
+        # Run GNN (forward batched with concurrent requests)
+        congestion = await predict_snapshot_coalesced(camera_dicts)
 
         return {
-            "congestion": float(congestion)
+            "congestion": float(congestion),
+            "failed_cameras": failed
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Prediction failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-
-    finally:
-        for tf in temp_files:
-            try: os.remove(tf)
-            except: pass
@@ -1,12 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List
-import requests
-import tempfile
-import os
 
+from backend.api_clients.camera_images import fetch_camera_images
 from backend.gnn_pipeline.inference import predict_for_snapshot
-from backend.gnn_pipeline.image_features import extract_features
+from backend.gnn_pipeline.feature_cache import extract_features_cached, fast_key
+from backend.gnn_pipeline.model_executor import model_executor, model_admission
 
 router = APIRouter()
 
@@ -24,7 +23,7 @@ class SimulationRequest(BaseModel):
 
 
 # ---------- SIMULATION ROUTE ----------
-@router.post("/simulate")
+@router.post("/simulate", dependencies=[Depends(model_admission)])
 async def simulate(req: SimulationRequest):
 
     try:
@@ -33,31 +32,31 @@ async def simulate(req: SimulationRequest):
         # --------------------------------------
         camera_dicts = []
 
-        for cam in req.cameras:
-            # Download image
-            img_data = requests.get(cam.ImageLink).content
+        # Download all camera images concurrently; failed cameras are reported, not fatal
+        fetched, failed = await fetch_camera_images(req.cameras)
+        if not fetched:
+            raise HTTPException(status_code=502, detail={"message": "No camera images could be downloaded", "failed_cameras": failed})
+        cameras = [cam for cam, _ in fetched]
+        images = [img for _, img in fetched]
 
-            # Save to temp file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-            temp_file.write(img_data)
-            temp_file.close()
-
-            # Extract AI features
-            vehicle_count, embedding = extract_features(temp_file.name)
+        # Extract AI features for the whole snapshot in one batch
+        counts, embeddings = await model_executor.run(
+            extract_features_cached,
+            images, fast_keys=[fast_key(cam.CameraID, cam.Timestamp) for cam in cameras]
+        )
 
+        for cam, vehicle_count, embedding in zip(cameras, counts, embeddings):
             camera_dicts.append({
                 "CameraID": cam.CameraID,
                 "Latitude": cam.Latitude,
                 "Longitude": cam.Longitude,
-                "vehicle_count": vehicle_count,
+                "vehicle_count": int(vehicle_count),
                 "embedding": embedding,
                 "Timestamp": cam.Timestamp
             })
 
-            os.remove(temp_file.name)
-
         # Compute baseline congestion via GNN
-        baseline_congestion = predict_for_snapshot(camera_dicts)
+        baseline_congestion = await model_executor.run(predict_for_snapshot, camera_dicts)
         total_vehicles = sum(c["vehicle_count"] for c in camera_dicts)
 
         baseline = {
@@ -85,8 +84,11 @@ async def simulate(req: SimulationRequest):
 
         return {
             "baseline": baseline,
-            "simulated": simulated
+            "simulated": simulated,
+            "failed_cameras": failed
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
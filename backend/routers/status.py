@@ -1,20 +1,48 @@
 """
 Status Router for UrbanPulse API
-Provides health check and API status endpoints
+Provides health check, readiness and API status endpoints
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+
+from backend.gnn_pipeline.inference import model_status
+from backend.gnn_pipeline.image_features import embedding_profile
+from backend.gnn_pipeline.model_registry import registry
+from backend.gnn_pipeline.batching import batching_stats
+from backend.gnn_pipeline.model_executor import model_executor
 
 router = APIRouter()
 
+# states that do not block serving ("unavailable" = optional model not installed)
+READY_STATES = {"ready", "unavailable"}
+
+
+def _readiness():
+    models = model_status()
+    return all(state in READY_STATES for state in models.values()), models
+
 
 @router.get("/status")
 async def get_status():
     """Get API status and health information"""
-    model = get_model()
+    ready, models = _readiness()
     return {
         "status": "healthy",
         "version": "1.0.0",
-        "ml_model_loaded": model is not None,
+        "ml_model_loaded": ready,
+        "ready": ready,
+        "models": models,
+        "embedding_profile": embedding_profile(),
+        "gnn_registry": registry.stats(),
+        "batching": batching_stats(),
+        "model_executor": model_executor.stats(),
         "message": "UrbanPulse API is running"
     }
 
+
+@router.get("/ready")
+async def get_ready(response: Response):
+    """Readiness probe: 200 once every model is loaded and warmed up, 503 before that"""
+    ready, models = _readiness()
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, "models": models}